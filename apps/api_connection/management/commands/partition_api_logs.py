@@ -0,0 +1,49 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.partitioning import MonthlyPartitionedTable, add_months, month_start
+
+PARTITIONED_LOG_TABLES = [
+    MonthlyPartitionedTable('api_connection_log', indexed_columns=('api_connection_id', )),
+    MonthlyPartitionedTable('google_calendar_api_log'),
+]
+
+
+class Command(BaseCommand):
+    help = "Keeps the API log tables partitioned by month: creates the upcoming partitions and " \
+           "drops the ones older than the retention period. Use --convert once to move existing data."
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'API_LOG_PARTITIONING', {})
+
+        parser.add_argument('--convert', action='store_true', default=False,
+                            help="Convert the plain log tables into partitioned ones, moving the existing rows")
+        parser.add_argument('--retention-months', type=int, default=config.get('RETENTION_MONTHS', 6))
+        parser.add_argument('--months-ahead', type=int, default=config.get('MONTHS_AHEAD', 2))
+
+    def handle(self, *args, **options):
+        current_month = month_start(datetime.date.today())
+
+        for table in PARTITIONED_LOG_TABLES:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if not table.is_partitioned(cursor):
+                    if not options['convert']:
+                        self.stdout.write("{} is not partitioned yet, run with --convert".format(table.table_name))
+                        continue
+
+                    self.stdout.write("Converting {} into a partitioned table".format(table.table_name))
+                    table.convert(cursor, options['months_ahead'])
+
+                created = table.create_partitions(cursor, current_month,
+                                                  add_months(current_month, options['months_ahead']))
+                dropped = table.drop_partitions_before(cursor,
+                                                       add_months(current_month, -options['retention_months']))
+
+            for name in created:
+                self.stdout.write("Partition is created: {}".format(name))
+
+            for name in dropped:
+                self.stdout.write("Partition is dropped: {}".format(name))
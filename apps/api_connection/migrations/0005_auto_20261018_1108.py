@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 11:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_connection', '0004_auto_20170821_0259'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apiconnectionlog',
+            name='api_connection',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api_connection.ApiConnection'),
+        ),
+    ]
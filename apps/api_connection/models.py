@@ -21,7 +21,8 @@ class ApiConnectionLog(NoUpdateTimeStampedMixin):
     class Meta:
         db_table = 'api_connection_log'
 
-    api_connection = models.ForeignKey(ApiConnection)
+    # partitioned table (see `partition_api_logs` command) can't have foreign key constraints
+    api_connection = models.ForeignKey(ApiConnection, db_constraint=False)
     resource = models.CharField(max_length=50, default='')
     args = JSONField(default={})
     response = JSONField(default={})
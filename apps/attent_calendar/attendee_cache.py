@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+
+from psqlextra.query import ConflictAction
+
+from apps.attent_calendar.models import InternalAttendee, ExternalAttendee
+
+
+class AttendeeCache:
+    """ Process-wide email address -> attendee id map of an attendee table
+
+    The same colleagues and prospects attend most of the meetings, so addresses are loaded on their
+    first use and the least recently used ones are evicted beyond `max_size`. The map isn't warmed up
+    by default: an RQ job runs in a freshly forked work horse and transforms a handful of changes, loading
+    attendees for it would cost more than the lookups it saves. Long runs transforming the whole outbox
+    of a client warm it up with the client's attendees, see `warm_up`.
+    A missing address is inserted with `ON CONFLICT DO NOTHING` and read back, so concurrent
+    transforms creating the same attendee end up with the same id.
+    Attendees are never deleted, hence a cached id never goes stale.
+    """
+
+    DEFAULT_MAX_SIZE = 100000
+
+    def __init__(self, attendee_model, max_size=DEFAULT_MAX_SIZE):
+        self._attendee_model = attendee_model
+        self._max_size = max_size
+        self._attendee_ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ids(self, email_addresses):
+        """
+        :return: dict of email address -> attendee id, missing attendees are created
+        """
+        attendee_ids = {}
+        missing_addresses = set()
+
+        with self._lock:
+            for email_address in email_addresses:
+                attendee_id = self._attendee_ids.get(email_address)
+                if attendee_id is None:
+                    missing_addresses.add(email_address)
+                    continue
+
+                self._attendee_ids.move_to_end(email_address)
+                attendee_ids[email_address] = attendee_id
+
+        if len(missing_addresses) > 0:
+            loaded_ids = self._load(missing_addresses)
+            attendee_ids.update(loaded_ids)
+
+            with self._lock:
+                self._attendee_ids.update(loaded_ids)
+                while len(self._attendee_ids) > self._max_size:
+                    self._attendee_ids.popitem(last=False)
+
+        return attendee_ids
+
+    def warm_up(self, client_id):
+        """
+        Loads the attendees of the client's events, up to `max_size` of them
+        """
+        attendee_ids = self._attendee_model.objects\
+            .filter(attent_calendar_event__client_id=client_id)\
+            .values_list('email_address', 'id')\
+            .distinct()[:self._max_size]
+
+        with self._lock:
+            self._attendee_ids.update(attendee_ids)
+            while len(self._attendee_ids) > self._max_size:
+                self._attendee_ids.popitem(last=False)
+
+    def _load(self, email_addresses):
+        self._attendee_model.objects\
+            .on_conflict(['email_address'], ConflictAction.NOTHING)\
+            .bulk_insert([{'email_address': email_address} for email_address in email_addresses])
+
+        return dict(self._attendee_model.objects
+                    .filter(email_address__in=email_addresses)
+                    .values_list('email_address', 'id'))
+
+    def clear(self):
+        with self._lock:
+            self._attendee_ids.clear()
+
+
+internal_attendee_cache = AttendeeCache(InternalAttendee)
+external_attendee_cache = AttendeeCache(ExternalAttendee)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 16:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0013_auto_20261018_1610'),
+        ('attent_calendar', '0004_auto_20170806_0111'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attentcalendarevent',
+            name='google_calendar_busy_block',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='google_calendar.GoogleCalendarBusyBlock'),
+        ),
+        migrations.AlterField(
+            model_name='attentcalendarevent',
+            name='google_calendar_event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='google_calendar.GoogleCalendarEvent'),
+        ),
+    ]
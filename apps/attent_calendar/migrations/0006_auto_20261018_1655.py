@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 16:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+MERGE_DUPLICATE_EVENTS_SQL = [
+    "CREATE TEMPORARY TABLE kept_attent_calendar_event AS "
+    "SELECT id, MAX(id) OVER (PARTITION BY google_calendar_event_id) AS kept_id "
+    "FROM attent_calendar_event WHERE google_calendar_event_id IS NOT NULL",
+
+    "UPDATE attent_calendar_event_has_internal_attendee l SET attent_calendar_event_id = m.kept_id "
+    "FROM kept_attent_calendar_event m WHERE l.attent_calendar_event_id = m.id AND m.id <> m.kept_id",
+
+    "UPDATE attent_calendar_event_has_external_attendee l SET attent_calendar_event_id = m.kept_id "
+    "FROM kept_attent_calendar_event m WHERE l.attent_calendar_event_id = m.id AND m.id <> m.kept_id",
+
+    "DELETE FROM attent_calendar_event a USING kept_attent_calendar_event m "
+    "WHERE a.id = m.id AND m.id <> m.kept_id",
+
+    "DROP TABLE kept_attent_calendar_event",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attent_calendar', '0005_auto_20261018_1612'),
+    ]
+
+    operations = [
+        # duplicates left by the transform keyed on the Google event id, the latest row is kept
+        # and the attendee links of the others are moved to it
+        migrations.RunSQL(
+            sql=MERGE_DUPLICATE_EVENTS_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql="DELETE FROM attent_calendar_event_has_internal_attendee a "
+                "USING attent_calendar_event_has_internal_attendee b "
+                "WHERE a.attent_calendar_event_id = b.attent_calendar_event_id "
+                "AND a.internal_attendee_id = b.internal_attendee_id AND a.id < b.id",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql="DELETE FROM attent_calendar_event_has_external_attendee a "
+                "USING attent_calendar_event_has_external_attendee b "
+                "WHERE a.attent_calendar_event_id = b.attent_calendar_event_id "
+                "AND a.external_attendee_id = b.external_attendee_id AND a.id < b.id",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterModelManagers(
+            name='attentcalendarevent',
+            managers=[
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='attentcalendareventhasexternalattendee',
+            managers=[
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='attentcalendareventhasinternalattendee',
+            managers=[
+            ],
+        ),
+        migrations.AlterField(
+            model_name='attentcalendarevent',
+            name='google_calendar_event',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, to='google_calendar.GoogleCalendarEvent'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='attentcalendareventhasexternalattendee',
+            unique_together=set([('attent_calendar_event', 'external_attendee')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='attentcalendareventhasinternalattendee',
+            unique_together=set([('attent_calendar_event', 'internal_attendee')]),
+        ),
+    ]
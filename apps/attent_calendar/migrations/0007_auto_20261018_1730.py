@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 17:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+MERGE_DUPLICATE_ATTENDEES_SQL = [
+    "CREATE TEMPORARY TABLE kept_{attendee} AS "
+    "SELECT id, MIN(id) OVER (PARTITION BY email_address) AS kept_id FROM {attendee}",
+
+    "DELETE FROM {link} l USING kept_{attendee} m, {link} l2, kept_{attendee} m2 "
+    "WHERE l.{attendee}_id = m.id AND l2.{attendee}_id = m2.id AND m.kept_id = m2.kept_id "
+    "AND l.attent_calendar_event_id = l2.attent_calendar_event_id AND l.id > l2.id",
+
+    "UPDATE {link} l SET {attendee}_id = m.kept_id FROM kept_{attendee} m "
+    "WHERE l.{attendee}_id = m.id AND m.id <> m.kept_id",
+
+    "DELETE FROM {attendee} a USING kept_{attendee} m WHERE a.id = m.id AND m.id <> m.kept_id",
+
+    "DROP TABLE kept_{attendee}",
+]
+
+
+def merge_duplicate_attendees_sql(attendee_table):
+    """
+    Attendees were created with `get_or_create` on a non-unique column, so an address may be duplicated.
+    The oldest attendee is kept, and the links of the others are moved to it.
+    """
+    link_table = 'attent_calendar_event_has_{}'.format(attendee_table)
+    return [sql.format(attendee=attendee_table, link=link_table) for sql in MERGE_DUPLICATE_ATTENDEES_SQL]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attent_calendar', '0006_auto_20261018_1655'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=merge_duplicate_attendees_sql('internal_attendee'),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql=merge_duplicate_attendees_sql('external_attendee'),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterModelManagers(
+            name='externalattendee',
+            managers=[
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='internalattendee',
+            managers=[
+            ],
+        ),
+        migrations.AlterField(
+            model_name='externalattendee',
+            name='email_address',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='internalattendee',
+            name='email_address',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
+from psqlextra.manager import PostgresManager
 
-from apps.google_calendar.models import GoogleCalendar, GoogleCalendarEvent
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarEvent, GoogleCalendarBusyBlock
 from apps.visualizer.models import Client
 from core.email_domains import is_email_address_personal
 from core.mixins import TimeStampedMixin
@@ -23,13 +24,19 @@ class AttentCalendar(TimeStampedMixin):
 class InternalAttendee(TimeStampedMixin):
     class Meta:
         db_table = 'internal_attendee'
-    email_address = models.CharField(db_index=True, max_length=255)
+
+    objects = PostgresManager()
+
+    email_address = models.CharField(unique=True, max_length=255)
 
 
 class ExternalAttendee(TimeStampedMixin):
     class Meta:
         db_table = 'external_attendee'
-    email_address = models.CharField(db_index=True, max_length=255)
+
+    objects = PostgresManager()
+
+    email_address = models.CharField(unique=True, max_length=255)
 
     @property
     def is_business_email_address(self):
@@ -40,7 +47,12 @@ class AttentCalendarEvent(TimeStampedMixin):
     class Meta:
         db_table = 'attent_calendar_event'
 
-    google_calendar_event = models.ForeignKey(GoogleCalendarEvent, on_delete=models.CASCADE)
+    EVENT_TYPE_UNKNOWN = 'Unknown'      # busy blocks of the calendars that are sync'ed in free/busy mode
+
+    objects = PostgresManager()
+
+    google_calendar_event = models.OneToOneField(GoogleCalendarEvent, null=True, on_delete=models.CASCADE)
+    google_calendar_busy_block = models.ForeignKey(GoogleCalendarBusyBlock, null=True, on_delete=models.CASCADE)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
 
     event_id = models.CharField(db_index=True, max_length=1024, default="", blank=True)    # Google Calendar Event Id
@@ -75,18 +87,22 @@ class AttentCalendarEvent(TimeStampedMixin):
 class AttentCalendarEventHasInternalAttendee(TimeStampedMixin):
     class Meta:
         db_table = 'attent_calendar_event_has_internal_attendee'
+        unique_together = ('attent_calendar_event', 'internal_attendee')
+
+    objects = PostgresManager()
+
     attent_calendar_event = models.ForeignKey(AttentCalendarEvent, on_delete=models.CASCADE)
     internal_attendee = models.ForeignKey(InternalAttendee, on_delete=models.CASCADE)
     response_status = models.CharField(max_length=20, default='')
 
-    index_together = ["attent_calendar_event", "internal_attendee"]
-
 
 class AttentCalendarEventHasExternalAttendee(TimeStampedMixin):
     class Meta:
         db_table = 'attent_calendar_event_has_external_attendee'
+        unique_together = ('attent_calendar_event', 'external_attendee')
+
+    objects = PostgresManager()
+
     attent_calendar_event = models.ForeignKey(AttentCalendarEvent, on_delete=models.CASCADE)
     external_attendee = models.ForeignKey(ExternalAttendee, on_delete=models.CASCADE)
     response_status = models.CharField(max_length=20, default='')
-
-    index_together = ["attent_calendar_event", "external_attendee"]
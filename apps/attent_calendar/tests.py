@@ -1,3 +1,187 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest.mock import patch
+
 from django.test import TestCase
+from model_mommy import mommy
+
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarBusyBlock, GoogleCalendarEvent, \
+    GoogleCalendarEventChange
+from apps.visualizer.models import Client, User
+from scripts.google_calendar.transform_google_calendar import transform_calendars
+from scripts.google_calendar.transform_google_calendar_busy_block import transform_busy_blocks
+from scripts.google_calendar.transform_google_calendar_event import transform_events, \
+    transform_events_in_batch, transform_events_partition, transform_saved_events
+from .attendee_cache import AttendeeCache, internal_attendee_cache, external_attendee_cache
+from .models import AttentCalendar, AttentCalendarEvent, AttentCalendarEventHasExternalAttendee, \
+    AttentCalendarEventHasInternalAttendee, InternalAttendee
+
+
+class EventTransformTest(TestCase):
+    def setUp(self):
+        self.client = mommy.make(Client, email_domain='something.com')
+
+        internal_attendee_cache.clear()     # ids cached in other tests are rolled back
+        external_attendee_cache.clear()
+
+    def _make_gc_event(self, event_id, attendees):
+        return mommy.make(GoogleCalendarEvent,
+                          client=self.client,
+                          event_id=event_id,
+                          start={'dateTime': '2017-11-02T10:00:00Z'},
+                          end={'dateTime': '2017-11-02T11:00:00Z'},
+                          attendees=attendees)
+
+    def test_events_are_transformed_in_batch(self):
+        gc_events = [
+            self._make_gc_event('e1', [{'email': 'rep@something.com', 'responseStatus': 'accepted'},
+                                       {'email': 'buyer@prospect.com', 'responseStatus': 'needsAction'}]),
+            self._make_gc_event('e2', [{'email': 'rep@something.com', 'responseStatus': 'accepted'}]),
+        ]
+
+        transform_events_in_batch(gc_events)
+
+        self.assertEqual(dict(AttentCalendarEvent.objects.values_list('event_id', 'event_type')),
+                         {'e1': 'External', 'e2': 'Internal'})
+        self.assertEqual(AttentCalendarEventHasInternalAttendee.objects.count(), 2)
+        self.assertEqual(AttentCalendarEventHasExternalAttendee.objects.get().response_status, 'needsAction')
+        self.assertFalse(GoogleCalendarEvent.objects.filter(process_time__isnull=True).exists())
+
+    def test_removed_attendee_is_unlinked(self):
+        gc_event = self._make_gc_event('e1', [{'email': 'rep@something.com', 'responseStatus': 'accepted'},
+                                              {'email': 'buyer@prospect.com', 'responseStatus': 'accepted'}])
+        transform_events_in_batch([gc_event])
+
+        gc_event.attendees = [{'email': 'rep@something.com', 'responseStatus': 'declined'}]
+        transform_events_in_batch([gc_event])
+
+        self.assertEqual(AttentCalendarEvent.objects.get().event_type, 'Internal')
+        self.assertFalse(AttentCalendarEventHasExternalAttendee.objects.exists())
+        self.assertEqual(AttentCalendarEventHasInternalAttendee.objects.get().response_status, 'declined')
+
+    def test_only_queued_changes_are_transformed(self):
+        changed_event = self._make_gc_event('e1', [])
+        self._make_gc_event('e2', [])
+        mommy.make(GoogleCalendarEventChange, client=self.client, google_calendar_event=changed_event, _quantity=2)
+
+        transform_events(app_client=self.client, batch_size=1)
+
+        self.assertEqual(list(AttentCalendarEvent.objects.values_list('event_id', flat=True)), ['e1'])
+        self.assertFalse(GoogleCalendarEventChange.objects.exists())
+
+    def test_partition_transforms_its_bucket_only(self):
+        gc_events = [self._make_gc_event('e{}'.format(i), []) for i in range(4)]
+        for gc_event in gc_events:
+            mommy.make(GoogleCalendarEventChange, client=self.client, google_calendar_event=gc_event)
+
+        bucket = gc_events[0].id % 2
+        self.assertTrue(transform_events_partition(self.client.id, bucket=bucket, bucket_count=2))
+
+        bucket_event_ids = {gc_event.event_id for gc_event in gc_events if gc_event.id % 2 == bucket}
+        self.assertEqual(set(AttentCalendarEvent.objects.values_list('event_id', flat=True)), bucket_event_ids)
+        self.assertEqual(GoogleCalendarEventChange.objects.count(), 4 - len(bucket_event_ids))
+
+    def test_saved_events_are_transformed_without_the_rest_of_the_outbox(self):
+        saved_event = self._make_gc_event('e1', [])
+        other_event = self._make_gc_event('e2', [])
+        for gc_event in (saved_event, other_event):
+            mommy.make(GoogleCalendarEventChange, client=self.client, google_calendar_event=gc_event)
+
+        transform_saved_events({saved_event.id})
+
+        self.assertEqual(list(AttentCalendarEvent.objects.values_list('event_id', flat=True)), ['e1'])
+        self.assertEqual(GoogleCalendarEventChange.objects.get().google_calendar_event_id, other_event.id)
+
+    def test_busy_block_covered_by_a_synced_event_is_removed(self):
+        calendar = mommy.make(GoogleCalendar, email_address='rep@something.com',
+                              sync_user=mommy.make(User, client=self.client))
+        for start_hour in (10, 15):
+            mommy.make(GoogleCalendarBusyBlock, calendar=calendar,
+                       start=datetime(2017, 11, 2, start_hour, 30, tzinfo=dt_timezone.utc),
+                       end=datetime(2017, 11, 2, start_hour + 1, 30, tzinfo=dt_timezone.utc))
+
+        transform_events_in_batch([self._make_gc_event('e1', [{'email': 'rep@something.com',
+                                                                'responseStatus': 'accepted'}])])
+        transform_busy_blocks(self.client)
+
+        block_event = AttentCalendarEvent.objects.get(google_calendar_busy_block__isnull=False)
+        self.assertEqual(block_event.start, datetime(2017, 11, 2, 15, 30, tzinfo=dt_timezone.utc))
+
+
+class CalendarTransformTest(TestCase):
+    def setUp(self):
+        self.client = mommy.make(Client, email_domain='something.com')
+        self.user = mommy.make(User, client=self.client)
+
+    def test_only_differing_calendars_are_written(self):
+        kept = mommy.make(GoogleCalendar, email_address='rep@something.com', sync_user=self.user,
+                          is_kept_in_sync=True, timezone='UTC')
+        dropped = mommy.make(GoogleCalendar, email_address='old@something.com', sync_user=self.user,
+                             is_kept_in_sync=True)
+        transform_calendars()
+
+        dropped.is_kept_in_sync = False
+        dropped.save()
+        kept.timezone = 'Europe/Istanbul'
+        kept.save()
+        mommy.make(GoogleCalendar, email_address='new@something.com', sync_user=self.user, is_kept_in_sync=True)
+
+        transform_calendars()
+
+        self.assertEqual(dict(AttentCalendar.objects.values_list('email_address', 'timezone')),
+                         {'rep@something.com': 'Europe/Istanbul', 'new@something.com': 'America/Los_Angeles'})
+
+    def test_nothing_is_written_without_changes(self):
+        mommy.make(GoogleCalendar, email_address='rep@something.com', sync_user=self.user, is_kept_in_sync=True)
+        transform_calendars()
+        updated_at = AttentCalendar.objects.get().db_updated_at
+
+        transform_calendars()
+        self.assertEqual(AttentCalendar.objects.get().db_updated_at, updated_at)
+
+    def test_failing_transform_is_reported(self):
+        self.assertTrue(transform_calendars(self.client))
+
+        with patch('scripts.google_calendar.transform_google_calendar.get_calendar_diff', side_effect=ValueError):
+            self.assertFalse(transform_calendars(self.client))
+
+
+class AttendeeCacheTest(TestCase):
+    def test_cached_attendee_is_not_queried(self):
+        attendee = mommy.make(InternalAttendee, email_address='rep@something.com')
+        cache = AttendeeCache(InternalAttendee)
+        cache.get_ids(['rep@something.com'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_ids(['rep@something.com']), {'rep@something.com': attendee.id})
+
+    def test_warmed_up_attendees_are_not_queried(self):
+        client = mommy.make(Client)
+        attendee = mommy.make(InternalAttendee, email_address='rep@something.com')
+        event = mommy.make(AttentCalendarEvent, client=client)
+        mommy.make(AttentCalendarEventHasInternalAttendee, attent_calendar_event=event, internal_attendee=attendee)
+        mommy.make(InternalAttendee, email_address='other@client.com')
+        cache = AttendeeCache(InternalAttendee)
+
+        cache.warm_up(client.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_ids(['rep@something.com']), {'rep@something.com': attendee.id})
+        with self.assertNumQueries(2):      # attendee of another client is loaded lazily
+            cache.get_ids(['other@client.com'])
+
+    def test_missing_attendee_is_created_once(self):
+        cache = AttendeeCache(InternalAttendee)
+        attendee_id = cache.get_ids(['new@something.com'])['new@something.com']
+
+        self.assertEqual(AttendeeCache(InternalAttendee).get_ids(['new@something.com']),
+                         {'new@something.com': attendee_id})
+        self.assertEqual(InternalAttendee.objects.count(), 1)
+
+    def test_least_recently_used_attendee_is_evicted(self):
+        cache = AttendeeCache(InternalAttendee, max_size=2)
+        cache.get_ids(['a@something.com', 'b@something.com'])
+        cache.get_ids(['a@something.com'])
+        cache.get_ids(['c@something.com'])
 
-# Create your tests here.
+        with self.assertNumQueries(0):
+            cache.get_ids(['a@something.com', 'c@something.com'])
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0004_googlecalendar_sync_user_access_role'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='googlecalendar',
+            managers=[
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='googlecalendarevent',
+            managers=[
+            ],
+        ),
+        migrations.AlterField(
+            model_name='googlecalendar',
+            name='email_address',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='googlecalendarevent',
+            name='event_id',
+            field=models.CharField(blank=True, default='', max_length=1024, unique=True),
+        ),
+    ]
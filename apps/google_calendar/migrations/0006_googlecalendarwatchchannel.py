@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 11:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0005_auto_20261018_1012'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleCalendarWatchChannel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_updated_at', models.DateTimeField(auto_now=True)),
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('channel_id', models.CharField(max_length=64, unique=True)),
+                ('resource_id', models.CharField(default='', max_length=255)),
+                ('token', models.CharField(max_length=64)),
+                ('expiration', models.DateTimeField(db_index=True)),
+                ('last_notification_datetime', models.DateTimeField(default=None, null=True)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watch_channels', related_query_name='watch_channel', to='google_calendar.GoogleCalendar')),
+            ],
+            options={
+                'db_table': 'google_calendar_watch_channel',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 12:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0006_googlecalendarwatchchannel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecalendar',
+            name='change_rate',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='googlecalendar',
+            name='next_sync_datetime',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 13:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0008_googlecalendar_history_sync_detail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecalendarevent',
+            name='canonical_key',
+            field=models.CharField(default=None, max_length=1100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='googlecalendarevent',
+            name='i_cal_uid',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+        migrations.AlterField(
+            model_name='googlecalendarevent',
+            name='event_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1024),
+        ),
+        migrations.CreateModel(
+            name='GoogleCalendarEventMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_updated_at', models.DateTimeField(auto_now=True)),
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('event_id', models.CharField(max_length=1024)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_memberships', related_query_name='event_membership', to='google_calendar.GoogleCalendar')),
+                ('google_calendar_event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', related_query_name='membership', to='google_calendar.GoogleCalendarEvent')),
+            ],
+            options={
+                'db_table': 'google_calendar_event_membership',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='googlecalendareventmembership',
+            unique_together=set([('calendar', 'event_id')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 14:25
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0009_client_warehouse_view_name_account'),
+        ('google_calendar', '0009_auto_20261018_1340'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleCalendarRecurringSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_updated_at', models.DateTimeField(auto_now=True)),
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('series_key', models.CharField(max_length=1100, unique=True)),
+                ('attendees', django.contrib.postgres.fields.jsonb.JSONField(default=[])),
+                ('creator', django.contrib.postgres.fields.jsonb.JSONField(default={})),
+                ('description', models.TextField(blank=True, default='')),
+                ('organizer', django.contrib.postgres.fields.jsonb.JSONField(default={})),
+                ('summary', models.TextField(blank=True, default='')),
+                ('client', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='visualizer.Client')),
+            ],
+            options={
+                'db_table': 'google_calendar_recurring_series',
+            },
+        ),
+        migrations.AddField(
+            model_name='googlecalendarevent',
+            name='inherited_fields',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=[]),
+        ),
+        migrations.AddField(
+            model_name='googlecalendarevent',
+            name='recurring_series',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', related_query_name='event', to='google_calendar.GoogleCalendarRecurringSeries'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 15:02
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('google_calendar', '0010_auto_20261018_1425'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleCalendarAccess',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_updated_at', models.DateTimeField(auto_now=True)),
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('access_role', models.CharField(default='freeBusyReader', max_length=30)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accesses', related_query_name='access', to='google_calendar.GoogleCalendar')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'google_calendar_access',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='googlecalendaraccess',
+            unique_together=set([('calendar', 'user')]),
+        ),
+    ]
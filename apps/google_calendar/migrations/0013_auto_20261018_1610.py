@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 16:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0012_googlecalendarevent_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleCalendarBusyBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_updated_at', models.DateTimeField(auto_now=True)),
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('process_time', models.DateTimeField(db_index=True, default=None, null=True)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='busy_blocks', related_query_name='busy_block', to='google_calendar.GoogleCalendar')),
+            ],
+            options={
+                'db_table': 'google_calendar_busy_block',
+            },
+        ),
+        migrations.AddField(
+            model_name='googlecalendar',
+            name='is_kept_in_free_busy_sync',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='googlecalendar',
+            name='last_free_busy_sync_datetime',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='googlecalendarbusyblock',
+            index_together=set([('calendar', 'start')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 18:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0009_client_warehouse_view_name_account'),
+        ('google_calendar', '0013_auto_20261018_1610'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleCalendarEventChange',
+            fields=[
+                ('db_created_at', models.DateTimeField(auto_now_add=True)),
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('client', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='visualizer.Client')),
+                ('google_calendar_event', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='google_calendar.GoogleCalendarEvent')),
+            ],
+            options={
+                'db_table': 'google_calendar_event_change',
+            },
+        ),
+        # events waiting for the transform before the outbox existed
+        migrations.RunSQL(
+            sql="INSERT INTO google_calendar_event_change (db_created_at, client_id, google_calendar_event_id) "
+                "SELECT NOW(), client_id, id FROM google_calendar_event "
+                "WHERE process_time IS NULL OR process_time < updated ORDER BY id",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 19:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0014_googlecalendareventchange'),
+    ]
+
+    operations = [
+        # sync users of the calendars listed before the accesses were recorded
+        migrations.RunSQL(
+            sql="INSERT INTO google_calendar_access (db_created_at, db_updated_at, calendar_id, user_id, access_role) "
+                "SELECT NOW(), NOW(), id, sync_user_id, sync_user_access_role FROM google_calendar "
+                "ON CONFLICT (calendar_id, user_id) DO NOTHING",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
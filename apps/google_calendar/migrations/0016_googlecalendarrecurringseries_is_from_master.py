@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 19:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_calendar', '0015_auto_20261018_1905'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecalendarrecurringseries',
+            name='is_from_master',
+            field=models.BooleanField(default=False),
+        ),
+        # series whose master is already stored
+        migrations.RunSQL(
+            sql="UPDATE google_calendar_recurring_series SET is_from_master = TRUE "
+                "WHERE series_key IN (SELECT canonical_key FROM google_calendar_event WHERE canonical_key IS NOT NULL)",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
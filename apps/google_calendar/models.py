@@ -1,5 +1,11 @@
+import datetime
+import hashlib
+import json
+
 from django.contrib.postgres.fields import JSONField
 from django.db import models
+from django.utils import dateparse
+from psqlextra.manager import PostgresManager
 
 from apps.visualizer.models import User, Client
 from core.mixins import TimeStampedMixin, NoUpdateTimeStampedMixin
@@ -57,8 +63,12 @@ class GoogleCalendar(TimeStampedMixin):
 
     KEY_PAGE_TOKEN = 'page_token'
     KEY_SYNC_TOKEN = 'sync_token'
+    KEY_TIME_MIN = 'time_min'
+    KEY_BACKFILL = 'backfill'       # progress of the windowed initial sync, see `CalendarBackfill`
+
+    objects = PostgresManager()
 
-    email_address = models.CharField(max_length=255)
+    email_address = models.CharField(max_length=255, unique=True)
     sync_detail = JSONField(default={KV_SYNC_STATE_KEY: KV_SYNC_STATE_VAL_UNINITIALIZED})
     sync_user = models.ForeignKey(User)
     sync_user_history = JSONField(default={})
@@ -66,6 +76,11 @@ class GoogleCalendar(TimeStampedMixin):
     is_kept_in_sync = models.BooleanField(db_index=True, default=True)
     timezone = models.CharField(max_length=50, default="America/Los_Angeles")
     sync_user_access_role = models.CharField(max_length=30, default="freeBusyReader")
+    change_rate = models.FloatField(default=0.0)        # changed events per hour, see `AdaptiveSyncScheduler`
+    next_sync_datetime = models.DateTimeField(null=True, default=None)
+    history_sync_detail = JSONField(default={})     # checkpoint of the events older than the sync horizon
+    is_kept_in_free_busy_sync = models.BooleanField(db_index=True, default=False)  # only busy blocks are readable
+    last_free_busy_sync_datetime = models.DateTimeField(null=True, default=None)
 
     def get_page_token(self):
         return self.sync_detail.get(self.KEY_PAGE_TOKEN, None)
@@ -77,10 +92,68 @@ class GoogleCalendar(TimeStampedMixin):
         return self.sync_detail
 
 
+class GoogleCalendarAccess(TimeStampedMixin):
+    """ A user who has the calendar in her calendar list, hence whose credentials can be used for its sync """
+    class Meta:
+        db_table = 'google_calendar_access'
+        unique_together = ('calendar', 'user')
+
+    READER_ROLES = ('owner', 'reader', 'writer')    # `freeBusyReader` can't read the events
+
+    objects = PostgresManager()
+
+    calendar = models.ForeignKey(GoogleCalendar,
+                                 on_delete=models.CASCADE,
+                                 related_name='accesses',
+                                 related_query_name='access')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    access_role = models.CharField(max_length=30, default="freeBusyReader")
+
+    def is_reader(self):
+        return self.access_role in self.READER_ROLES
+
+
+class GoogleCalendarRecurringSeries(TimeStampedMixin):
+    """ Content shared by the master and the instances of a recurring event, stored once per series.
+    Events of the series keep only the fields that differ from the series, see `GoogleCalendarEvent.inherited_fields`
+    """
+    class Meta:
+        db_table = 'google_calendar_recurring_series'
+
+    INHERITABLE_FIELDS = {      # field -> value stored in an event inheriting it
+        'attendees': [],
+        'creator': {},
+        'description': '',
+        'organizer': {},
+        'summary': '',
+    }
+
+    objects = PostgresManager()
+
+    client = models.ForeignKey(Client, null=True)
+
+    series_key = models.CharField(unique=True, max_length=1100)
+    attendees = JSONField(default=[])
+    creator = JSONField(default={})
+    description = models.TextField(default="", blank=True)
+    organizer = JSONField(default={})
+    summary = models.TextField(default="", blank=True)
+    is_from_master = models.BooleanField(default=False)     # content is taken from an instance until then
+
+    @staticmethod
+    def get_series_key(client_id, i_cal_uid):
+        return '{}:{}'.format(client_id, i_cal_uid)     # canonical key of the series' master
+
+
 class GoogleCalendarEvent(TimeStampedMixin):
+    """ An event is stored once even if it is fetched from the calendar of each attendee,
+    see `get_canonical_key`. The calendars it is seen in are kept in `GoogleCalendarEventMembership`
+    """
     class Meta:
         db_table = 'google_calendar_event'
 
+    objects = PostgresManager()
+
     client = models.ForeignKey(Client, null=True)
 
     attendees = JSONField(default=[])
@@ -90,6 +163,8 @@ class GoogleCalendarEvent(TimeStampedMixin):
     end = JSONField(default={})
     html_link = models.CharField(max_length=2083, default="", blank=True)
     event_id = models.CharField(db_index=True, max_length=1024, default="", blank=True)
+    i_cal_uid = models.CharField(max_length=1024, default="", blank=True)
+    canonical_key = models.CharField(unique=True, max_length=1100, null=True, default=None)
     organizer = JSONField(default={})       # Organizer: The one that own the event in her calendar
     recurring_event_id = models.CharField(max_length=1024, default="", blank=True)
     start = JSONField(default={})
@@ -97,3 +172,137 @@ class GoogleCalendarEvent(TimeStampedMixin):
     summary = models.TextField(default="", blank=True)
     updated = models.DateTimeField()
     process_time = models.DateTimeField(db_index=True, null=True, default=None)
+    recurring_series = models.ForeignKey(GoogleCalendarRecurringSeries,
+                                         null=True,
+                                         default=None,
+                                         on_delete=models.SET_NULL,
+                                         related_name='events',
+                                         related_query_name='event')
+    inherited_fields = JSONField(default=[])    # fields read from `recurring_series`
+    content_hash = models.CharField(max_length=40, default="", blank=True)     # see `get_content_hash`
+
+    def read_through_series(self):
+        """
+        Fills the inherited fields from the recurring series, the event must not be saved with them afterwards
+        """
+        for field in self.inherited_fields:
+            setattr(self, field, getattr(self.recurring_series, field))
+
+    @staticmethod
+    def get_content_hash(event_row):
+        """
+        Hashes only the content the copies of a meeting in different calendars share, the copy of another
+        calendar is not written again when it has the same content. Ids and links of the copy (`event_id`,
+        `html_link`), the `self` flags and the time zone times are rendered in differ between copies.
+        :param event_row: row of the event, as saved by `CalendarStorage`
+        """
+        attendees = sorted(({key: value for key, value in attendee.items() if key != 'self'}
+                            for attendee in event_row['attendees']),
+                           key=lambda attendee: attendee.get('email', ''))
+        content = {
+            'canonical_key': event_row['canonical_key'],
+            'status': event_row['status'],
+            'summary': event_row['summary'],
+            'description': event_row['description'],
+            'start': GoogleCalendarEvent.get_utc_start(event_row['start']),
+            'end': GoogleCalendarEvent.get_utc_start(event_row['end']),
+            'organizer': event_row['organizer'].get('email'),
+            'creator': event_row['creator'].get('email'),
+            'attendees': attendees,
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_utc_start(start):
+        """
+        `dateTime` is rendered in the time zone of the calendar it is fetched from, the copies of a meeting
+        in calendars of different time zones have the same key only after it is normalized to UTC
+        :param start: `start`, `end` or `originalStartTime` of an event resource
+        """
+        if 'dateTime' not in start:
+            return start.get('date')
+
+        start_time = dateparse.parse_datetime(start['dateTime'])
+        return start_time.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    @staticmethod
+    def get_canonical_key(client_id, event_item):
+        """
+        The copies of a meeting in the attendees' calendars share the `iCalUID`, the instances
+        of a recurring meeting share it, too, and differ by their `originalStartTime`.
+        Events are deduplicated within a client only.
+        :param event_item: event resource of the Calendar API
+        """
+        i_cal_uid = event_item.get('iCalUID')
+        if not i_cal_uid:
+            return '{}:id:{}'.format(client_id, event_item.get('id'))
+
+        original_start = event_item.get('originalStartTime')
+        if original_start:
+            return '{}:{}:{}'.format(client_id, i_cal_uid, GoogleCalendarEvent.get_utc_start(original_start))
+
+        return GoogleCalendarRecurringSeries.get_series_key(client_id, i_cal_uid)
+
+
+class GoogleCalendarEventChange(NoUpdateTimeStampedMixin):
+    """ Outbox of the stored event changes, written in the transaction of the change and consumed
+    (then deleted) by the event transform in id order
+    """
+    class Meta:
+        db_table = 'google_calendar_event_change'
+
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey(Client, null=True, db_constraint=False, on_delete=models.DO_NOTHING)
+    google_calendar_event = models.ForeignKey(GoogleCalendarEvent, db_constraint=False, on_delete=models.DO_NOTHING)
+
+
+class GoogleCalendarEventMembership(TimeStampedMixin):
+    """ A calendar the (canonical) event is seen in, with the calendar's own id for the event """
+    class Meta:
+        db_table = 'google_calendar_event_membership'
+        unique_together = ('calendar', 'event_id')
+
+    objects = PostgresManager()
+
+    calendar = models.ForeignKey(GoogleCalendar,
+                                 on_delete=models.CASCADE,
+                                 related_name='event_memberships',
+                                 related_query_name='event_membership')
+    google_calendar_event = models.ForeignKey(GoogleCalendarEvent,
+                                              on_delete=models.CASCADE,
+                                              related_name='memberships',
+                                              related_query_name='membership')
+    event_id = models.CharField(max_length=1024)
+
+
+class GoogleCalendarBusyBlock(TimeStampedMixin):
+    """ Busy time of a calendar whose events can't be read (`freeBusyReader`), see `CalendarFreeBusySyncer` """
+    class Meta:
+        db_table = 'google_calendar_busy_block'
+        index_together = ('calendar', 'start')
+
+    calendar = models.ForeignKey(GoogleCalendar,
+                                 on_delete=models.CASCADE,
+                                 related_name='busy_blocks',
+                                 related_query_name='busy_block')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    process_time = models.DateTimeField(db_index=True, null=True, default=None)
+
+
+class GoogleCalendarWatchChannel(TimeStampedMixin):
+    """ Push notification channel (https://developers.google.com/google-apps/calendar/v3/push)
+    watching the events of a calendar
+    """
+    class Meta:
+        db_table = 'google_calendar_watch_channel'
+
+    calendar = models.ForeignKey(GoogleCalendar,
+                                 on_delete=models.CASCADE,
+                                 related_name='watch_channels',
+                                 related_query_name='watch_channel')
+    channel_id = models.CharField(max_length=64, unique=True)
+    resource_id = models.CharField(max_length=255, default='')
+    token = models.CharField(max_length=64)
+    expiration = models.DateTimeField(db_index=True)
+    last_notification_datetime = models.DateTimeField(null=True, default=None)
@@ -1,3 +1,528 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+import fakeredis
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase, Client as HttpClient, override_settings
+from django.utils import timezone
+from model_mommy import mommy
+
+from apps.visualizer.models import User, Client as AttentClient
+from core.sync_engine.api_log_writer import BufferedApiLogWriter
+from core.sync_engine.google_calendar_free_busy import CalendarFreeBusySyncer
+from core.sync_engine.google_calendar_syncer import CalendarBackfill, CalendarHistorySync, CalendarReaderPool, \
+    CalendarStorage, CalendarSyncer
+from core.sync_engine.quota import GoogleApiQuota
+from core.sync_engine.scheduler import AdaptiveSyncScheduler
+from .models import GoogleCalendar, GoogleCalendarAccess, GoogleCalendarBusyBlock, GoogleCalendarEvent, \
+    GoogleCalendarWatchChannel
+
+
+def _event_item(event_id, summary='Meeting', status='confirmed', updated='2017-11-01T10:00:00Z', i_cal_uid=None):
+    return {
+        'id': event_id,
+        'iCalUID': i_cal_uid or '{}@google.com'.format(event_id),
+        'status': status,
+        'summary': summary,
+        'created': '2017-11-01T09:00:00Z',
+        'updated': updated,
+        'start': {'dateTime': '2017-11-02T10:00:00Z'},
+        'end': {'dateTime': '2017-11-02T11:00:00Z'},
+        'attendees': [{'email': 'rep@something.com', 'responseStatus': 'accepted'}],
+    }
+
+
+class CalendarStorageTest(TestCase):
+    def setUp(self):
+        self.client = mommy.make(AttentClient, email_domain='something.com')
+        self.user = mommy.make(User, email='rep@something.com', client=self.client)
+        self.calendar = mommy.make(GoogleCalendar, email_address='team@something.com', sync_user=self.user)
+
+    def test_save_calendar_events_upserts_a_page(self):
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1'), _event_item('e2')]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1', summary='Renamed')]}, self.calendar)
+
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 2)
+        self.assertEqual(GoogleCalendarEvent.objects.get(event_id='e1').summary, 'Renamed')
+
+    def test_save_calendar_events_deletes_cancelled_events(self):
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1'), _event_item('e2')]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [{'id': 'e1', 'status': 'cancelled'}]}, self.calendar)
+
+        self.assertEqual(list(GoogleCalendarEvent.objects.values_list('event_id', flat=True)), ['e2'])
+
+    def test_unchanged_events_are_not_written(self):
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1'), _event_item('e2')]}, self.calendar)
+
+        with self.assertNumQueries(3):      # legacy lookup, stored hashes and memberships, no writes
+            CalendarStorage.save_calendar_events({'items': [_event_item('e1'), _event_item('e2')]}, self.calendar)
+
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1', summary='Renamed')]}, self.calendar)
+        self.assertEqual(GoogleCalendarEvent.objects.get(event_id='e1').summary, 'Renamed')
+
+    def test_only_changed_events_are_reported(self):
+        saved_pages = []
+        storage = CalendarStorage(lambda **kwargs: None, on_events_saved=saved_pages.append)
+
+        for summary in ('Meeting', 'Meeting', 'Renamed'):
+            changed_event_pks = storage.save_calendar_events_page({'items': [_event_item('e1', summary=summary)]},
+                                                                  self.calendar, sync_detail={})
+            storage.events_saved(changed_event_pks)
+
+        event_pk = GoogleCalendarEvent.objects.get().id
+        self.assertEqual(saved_pages, [{event_pk}, {event_pk}])
+
+    def test_shared_meeting_is_stored_once(self):
+        other_calendar = mommy.make(GoogleCalendar, email_address='other@something.com', sync_user=self.user)
+
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1', i_cal_uid='meeting')]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [_event_item('e2', i_cal_uid='meeting')]}, other_calendar)
+
+        event = GoogleCalendarEvent.objects.get()
+        self.assertEqual(event.memberships.count(), 2)
+
+        CalendarStorage.save_calendar_events({'items': [{'id': 'e1', 'status': 'cancelled'}]}, self.calendar)
+        self.assertEqual(list(event.memberships.values_list('event_id', flat=True)), ['e2'])
+
+        CalendarStorage.save_calendar_events({'items': [{'id': 'e2', 'status': 'cancelled'}]}, other_calendar)
+        self.assertFalse(GoogleCalendarEvent.objects.exists())
+
+    def test_copies_from_different_time_zones_are_stored_once(self):
+        other_calendar = mommy.make(GoogleCalendar, email_address='other@something.com', sync_user=self.user)
+        instance = dict(_event_item('weekly_20171109', i_cal_uid='weekly'), recurringEventId='weekly')
+
+        CalendarStorage.save_calendar_events({'items': [
+            dict(instance, originalStartTime={'dateTime': '2017-11-09T10:00:00Z'})]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [
+            dict(instance, originalStartTime={'dateTime': '2017-11-09T13:00:00+03:00'})]}, other_calendar)
+
+        self.assertEqual(GoogleCalendarEvent.objects.get().canonical_key, '{}:weekly:2017-11-09T10:00:00Z'
+                         .format(self.client.id))
+
+    def test_guest_copy_does_not_drop_attendees(self):
+        other_calendar = mommy.make(GoogleCalendar, email_address='other@something.com', sync_user=self.user)
+        attendees = [{'email': 'team@something.com', 'responseStatus': 'needsAction'},
+                     {'email': 'other@something.com', 'responseStatus': 'needsAction'},
+                     {'email': 'buyer@prospect.com', 'responseStatus': 'accepted'}]
+
+        CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e1', i_cal_uid='meeting'), attendees=attendees,
+                 organizer={'email': 'team@something.com', 'self': True})]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e2', i_cal_uid='meeting'), attendees=[{'email': 'other@something.com',
+                                                                     'responseStatus': 'accepted'}],
+                 organizer={'email': 'team@something.com'})]}, other_calendar)
+
+        event = GoogleCalendarEvent.objects.get()
+        self.assertEqual(len(event.attendees), 3)
+        self.assertEqual(event.attendees[1]['responseStatus'], 'accepted')
+
+    def test_organizer_copy_removes_attendees(self):
+        attendees = [{'email': 'team@something.com', 'responseStatus': 'accepted', 'self': True},
+                     {'email': 'other@something.com', 'responseStatus': 'needsAction'},
+                     {'email': 'buyer@prospect.com', 'responseStatus': 'accepted'}]
+        organizer = {'email': 'team@something.com', 'self': True}
+
+        CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e1'), attendees=attendees, organizer=organizer)]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e1', updated='2017-11-02T10:00:00Z'), attendees=attendees[:2],
+                 organizer=organizer)]}, self.calendar)
+
+        event = GoogleCalendarEvent.objects.get()
+        self.assertEqual([attendee['email'] for attendee in event.attendees],
+                         ['team@something.com', 'other@something.com'])
+
+    def test_unchanged_copy_from_another_calendar_is_not_written(self):
+        other_calendar = mommy.make(GoogleCalendar, email_address='other@something.com', sync_user=self.user)
+        attendees = [{'email': 'team@something.com', 'responseStatus': 'accepted', 'self': True},
+                     {'email': 'other@something.com', 'responseStatus': 'accepted'},
+                     {'email': 'buyer@prospect.com', 'responseStatus': 'accepted'}]
+
+        CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e1', i_cal_uid='meeting'), attendees=attendees, htmlLink='https://calendar/e1',
+                 organizer={'email': 'team@something.com', 'self': True})]}, self.calendar)
+        changed_event_pks = CalendarStorage.save_calendar_events({'items': [
+            dict(_event_item('e2', i_cal_uid='meeting'), htmlLink='https://calendar/e2',
+                 start={'dateTime': '2017-11-02T13:00:00+03:00'}, end={'dateTime': '2017-11-02T14:00:00+03:00'},
+                 attendees=[{'email': 'other@something.com', 'responseStatus': 'accepted', 'self': True}],
+                 organizer={'email': 'team@something.com'})]}, other_calendar)
+
+        self.assertEqual(changed_event_pks, set())
+        self.assertEqual(GoogleCalendarEvent.objects.get().html_link, 'https://calendar/e1')
+
+    def test_event_stored_under_an_old_key_is_rekeyed(self):
+        instance = dict(_event_item('weekly_20171109', i_cal_uid='weekly'), recurringEventId='weekly',
+                        originalStartTime={'dateTime': '2017-11-09T13:00:00+03:00'})
+        CalendarStorage.save_calendar_events({'items': [instance]}, self.calendar)
+        GoogleCalendarEvent.objects.update(canonical_key='{}:weekly:2017-11-09T13:00:00+03:00'.format(self.client.id))
+        stored_event = GoogleCalendarEvent.objects.get()
+
+        CalendarStorage.save_calendar_events({'items': [dict(instance, summary='Renamed')]}, self.calendar)
+
+        event = GoogleCalendarEvent.objects.get()
+        self.assertEqual(event.id, stored_event.id)
+        self.assertEqual(event.summary, 'Renamed')
+
+    def test_recurring_instance_keeps_only_overrides(self):
+        master = dict(_event_item('weekly', summary='Weekly'), recurrence=['RRULE:FREQ=WEEKLY'])
+        instance = dict(_event_item('weekly_20171109', summary='Weekly'),
+                        recurringEventId='weekly',
+                        iCalUID=master['iCalUID'],
+                        originalStartTime={'dateTime': '2017-11-09T10:00:00Z'},
+                        attendees=[])
+
+        CalendarStorage.save_calendar_events({'items': [master, instance]}, self.calendar)
+
+        stored_instance = GoogleCalendarEvent.objects.get(event_id='weekly_20171109')
+        self.assertEqual(stored_instance.summary, '')
+        self.assertIn('summary', stored_instance.inherited_fields)
+        self.assertNotIn('attendees', stored_instance.inherited_fields)
+
+        stored_instance.read_through_series()
+        self.assertEqual(stored_instance.summary, 'Weekly')
+        self.assertEqual(stored_instance.attendees, [])
+
+    def test_instance_fetched_before_its_master_keeps_its_overrides(self):
+        master = dict(_event_item('weekly', summary='Weekly'), recurrence=['RRULE:FREQ=WEEKLY'])
+        instance = dict(_event_item('weekly_20171109', summary='Moved Weekly'),
+                        recurringEventId='weekly',
+                        iCalUID=master['iCalUID'],
+                        originalStartTime={'dateTime': '2017-11-09T10:00:00Z'})
+
+        CalendarStorage.save_calendar_events({'items': [instance]}, self.calendar)
+        CalendarStorage.save_calendar_events({'items': [master]}, self.calendar)
+
+        stored_instance = GoogleCalendarEvent.objects.get(event_id='weekly_20171109')
+        self.assertNotIn('summary', stored_instance.inherited_fields)
+
+        stored_instance.read_through_series()
+        self.assertEqual(stored_instance.summary, 'Moved Weekly')
+        self.assertEqual(stored_instance.recurring_series.summary, 'Weekly')
+
+    def test_legacy_event_is_adopted(self):
+        legacy_event = mommy.make(GoogleCalendarEvent, event_id='e1', client=self.client)
+
+        CalendarStorage.save_calendar_events({'items': [_event_item('e1', summary='Renamed')]}, self.calendar)
+
+        event = GoogleCalendarEvent.objects.get()
+        self.assertEqual(event.id, legacy_event.id)
+        self.assertEqual(event.summary, 'Renamed')
+        self.assertIsNotNone(event.canonical_key)
+
+    def test_save_calendars_keeps_sync_user_history(self):
+        other_user = mommy.make(User, email='other@something.com', client=self.client)
+        response = {'items': [{'id': 'rep@something.com', 'timeZone': 'UTC', 'accessRole': 'owner'}]}
+
+        CalendarStorage.save_calendars(response, self.user)
+        CalendarStorage.save_calendars(response, other_user)
+        self.assertEqual(GoogleCalendar.objects.get(email_address='rep@something.com').sync_user_id, self.user.id)
+
+        CalendarStorage.save_calendars({'items': [{'id': 'rep@something.com', 'deleted': True}]}, self.user)
+
+        calendar = GoogleCalendar.objects.get(email_address='rep@something.com')
+        self.assertEqual(calendar.sync_user_id, other_user.id)
+        self.assertTrue(calendar.is_kept_in_sync)
+        self.assertEqual(calendar.sync_user_history['list'][0]['user_id'], self.user.id)
+
+    def test_free_busy_listing_does_not_switch_off_event_sync(self):
+        other_user = mommy.make(User, email='other@something.com', client=self.client)
+
+        CalendarStorage.save_calendars({'items': [{'id': 'rep@something.com', 'accessRole': 'reader'}]}, self.user)
+        CalendarStorage.save_calendars({'items': [{'id': 'rep@something.com', 'accessRole': 'freeBusyReader'}]},
+                                       other_user)
+
+        calendar = GoogleCalendar.objects.get(email_address='rep@something.com')
+        self.assertEqual(calendar.sync_user_id, self.user.id)
+        self.assertEqual(calendar.sync_user_access_role, 'reader')
+        self.assertTrue(calendar.is_kept_in_sync)
+        self.assertFalse(calendar.is_kept_in_free_busy_sync)
+
+    def test_save_calendars_records_every_reader(self):
+        other_user = mommy.make(User, email='other@something.com', client=self.client)
+
+        CalendarStorage.save_calendars({'items': [{'id': 'rep@something.com', 'accessRole': 'owner'}]}, self.user)
+        CalendarStorage.save_calendars({'items': [{'id': 'rep@something.com', 'accessRole': 'reader'}]}, other_user)
+
+        calendar = GoogleCalendar.objects.get(email_address='rep@something.com')
+        self.assertEqual(dict(calendar.accesses.values_list('user_id', 'access_role')),
+                         {self.user.id: 'owner', other_user.id: 'reader'})
+
+
+class CalendarReaderPoolTest(TestCase):
+    def setUp(self):
+        client = mommy.make(AttentClient, email_domain='something.com')
+        self.users = [mommy.make(User, email='rep{}@something.com'.format(i), client=client) for i in range(3)]
+        self.calendar = mommy.make(GoogleCalendar, email_address='team@something.com', sync_user=self.users[0])
+
+        for user in self.users:
+            mommy.make(GoogleCalendarAccess, calendar=self.calendar, user=user, access_role='reader')
+
+        self.pool = CalendarReaderPool()
+
+    def test_every_reader_is_used(self):
+        self.assertEqual(set(self.pool.get_readers(self.calendar)), set(self.users))
+
+    def test_unavailable_reader_is_left_out(self):
+        self.pool.mark_unavailable(self.users[1], 'quota')
+
+        self.assertNotIn(self.users[1], self.pool.get_readers(self.calendar))
+
+    def test_sync_user_is_the_last_resort(self):
+        for user in self.users:
+            self.pool.mark_unavailable(user, 'quota')
+
+        self.assertEqual(self.pool.get_readers(self.calendar), [self.users[0]])
+
+
+class StubBatchRequest:
+    def __init__(self, callback, responses):
+        self._callback = callback
+        self._responses = responses
+        self._request_ids = []
+
+    def add(self, request, request_id):
+        self._request_ids.append(request_id)
+
+    def execute(self):
+        for request_id in self._request_ids:
+            self._callback(request_id, self._responses[int(request_id)], None)
+
+
+class CalendarBatchPollTest(TestCase):     # the saves take the advisory lock of the calendar
+    def test_calendar_failing_to_save_is_left_for_the_regular_sync(self):
+        calendars = [Mock(id=index, email_address='rep{}@something.com'.format(index)) for index in range(2)]
+        service = Mock()
+        service.new_batch_http_request.side_effect = lambda callback: StubBatchRequest(callback, [{}, {}])
+
+        with patch('core.sync_engine.google_calendar_syncer.CalendarConnector.get_for_user') as get_for_user:
+            get_for_user.return_value.get_service.return_value = service
+            syncer = CalendarSyncer(user=Mock(), storage=Mock())
+
+        def save_page(calendar, query_params, response):
+            if calendar is calendars[0]:
+                raise ValueError("Broken page")
+            return None, 'sync-token'
+
+        with patch.object(syncer, '_get_calendar_events_query_params', return_value={}), \
+                patch.object(syncer, '_save_calendar_events_page', side_effect=save_page):
+            calendars_to_sync, change_counts = syncer.poll_calendar_events_in_batch(calendars)
+
+        self.assertEqual(calendars_to_sync, [calendars[0]])
+        self.assertEqual(change_counts, {1: 0})
+
+
+class BufferedApiLogWriterTest(SimpleTestCase):
+    def test_summarize_response_drops_items(self):
+        writer = BufferedApiLogWriter(kept_item_count=1)
+        summary = writer.summarize_response({'items': [_event_item('e1'), _event_item('e2')],
+                                             'nextSyncToken': 'token'})
+
+        self.assertEqual(summary['itemCount'], 2)
+        self.assertEqual(summary['nextSyncToken'], 'token')
+        self.assertEqual([item['id'] for item in summary['items']], ['e1'])
+        self.assertEqual(len(summary['sha1']), 40)
+
+    def test_successful_responses_are_sampled_out(self):
+        writer = BufferedApiLogWriter(sample_rate=0)
+        writer.log(email_address='rep@something.com', resource='events', args={}, response={'items': []})
+
+        self.assertTrue(writer._queue.empty())
+
+
+@override_settings(GOOGLE_API_QUOTA={'PROJECT_RATE': 10, 'PROJECT_CAPACITY': 20, 'USER_RATE': 5, 'USER_CAPACITY': 10})
+class GoogleApiQuotaTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+
+        def sleep(seconds):
+            self.now += seconds
+
+        patcher = patch('core.sync_engine.quota.time')
+        mock_time = patcher.start()
+        mock_time.time.side_effect = lambda: self.now
+        mock_time.sleep.side_effect = sleep
+        self.addCleanup(patcher.stop)
+
+        self.quota = GoogleApiQuota(redis_connection=fakeredis.FakeStrictRedis())
+
+    def test_empty_bucket_refills_over_time(self):
+        self.assertEqual(self.quota.try_acquire(user_id=1, count=10), 0)
+        self.assertAlmostEqual(self.quota.try_acquire(user_id=1), 0.2)     # user rate is 5 per second
+
+        self.now += 0.2
+        self.assertEqual(self.quota.try_acquire(user_id=1), 0)
+
+    def test_bucket_is_capped(self):
+        self.quota.try_acquire(user_id=1)
+        self.now += 60 * 60
+
+        self.assertEqual(self.quota.try_acquire(user_id=1, count=10), 0)
+        self.assertGreater(self.quota.try_acquire(user_id=1), 0)
+
+    def test_more_tokens_than_capacity_are_taken_in_chunks(self):
+        with self.assertRaises(ValueError):
+            self.quota.try_acquire(user_id=1, count=11)
+
+        self.quota.acquire(user_id=1, count=49)     # e.g. the calls of a batch poll
+
+        self.assertAlmostEqual(self.now - 1000.0, (49 - 10) / 5)    # full user bucket, then its rate
+
+
+class StubChannelNotifier:
+    """ Sends notifications the way Google does for a watch channel """
+    def __init__(self, channel: GoogleCalendarWatchChannel):
+        self.channel = channel
+        self.http_client = HttpClient()
+
+    def notify(self, resource_state='exists', token=None):
+        return self.http_client.post(reverse('google_calendar_notification'),
+                                     HTTP_X_GOOG_CHANNEL_ID=self.channel.channel_id,
+                                     HTTP_X_GOOG_CHANNEL_TOKEN=token or self.channel.token,
+                                     HTTP_X_GOOG_RESOURCE_ID=self.channel.resource_id,
+                                     HTTP_X_GOOG_RESOURCE_STATE=resource_state)
+
+
+@patch('apps.google_calendar.works.enqueue_calendar_events_sync')
+class CalendarNotificationTest(TestCase):
+    def setUp(self):
+        self.calendar = mommy.make(GoogleCalendar, email_address='rep@something.com')
+        self.channel = mommy.make(GoogleCalendarWatchChannel,
+                                  calendar=self.calendar,
+                                  channel_id='channel-1',
+                                  token='secret',
+                                  expiration=timezone.now() + timedelta(days=7))
+        self.notifier = StubChannelNotifier(self.channel)
+
+    def test_change_notification_enqueues_calendar_sync(self, enqueue_mock):
+        response = self.notifier.notify()
+
+        self.assertEqual(response.status_code, 200)
+        enqueue_mock.assert_called_once_with(self.calendar.id)
+
+    def test_sync_notification_is_ignored(self, enqueue_mock):
+        self.notifier.notify(resource_state='sync')
+
+        enqueue_mock.assert_not_called()
+
+    def test_notification_with_wrong_token_is_rejected(self, enqueue_mock):
+        response = self.notifier.notify(token='wrong')
+
+        self.assertEqual(response.status_code, 404)
+        enqueue_mock.assert_not_called()
+
+
+class AdaptiveSyncSchedulerTest(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = AdaptiveSyncScheduler()
+
+    def test_busy_calendars_are_polled_more_often(self):
+        busy_interval = self.scheduler.get_next_interval(change_rate=4)
+        quiet_interval = self.scheduler.get_next_interval(change_rate=0.5)
+
+        self.assertLess(busy_interval, quiet_interval)
+
+    def test_intervals_are_bounded(self):
+        self.assertEqual(self.scheduler.get_next_interval(change_rate=1000), AdaptiveSyncScheduler.MIN_INTERVAL)
+        self.assertEqual(self.scheduler.get_next_interval(change_rate=0), AdaptiveSyncScheduler.MAX_INTERVAL)
+
+    def test_change_rate_moves_towards_observation(self):
+        rate = self.scheduler.get_updated_change_rate(change_rate=1, change_count=10, elapsed=timedelta(hours=1))
+
+        self.assertGreater(rate, 1)
+        self.assertLess(rate, 10)
+
+    def test_uninitialized_calendar_is_always_due(self):
+        calendar = GoogleCalendar(next_sync_datetime=timezone.now() + timedelta(hours=1))
+
+        self.assertTrue(AdaptiveSyncScheduler.is_calendar_due(calendar))
+
+
+class CalendarBackfillTest(SimpleTestCase):
+    def test_split_time_range_in_month_windows(self):
+        windows = CalendarBackfill.split_time_range(datetime(2017, 1, 1, tzinfo=dt_timezone.utc),
+                                                    datetime(2017, 8, 15, tzinfo=dt_timezone.utc),
+                                                    window_months=3)
+
+        self.assertEqual(windows, [
+            ('2017-01-01T00:00:00+00:00', '2017-04-01T00:00:00+00:00'),
+            ('2017-04-01T00:00:00+00:00', '2017-07-01T00:00:00+00:00'),
+            ('2017-07-01T00:00:00+00:00', None),
+        ])
+
+    def test_backfill_is_needed_only_before_the_first_sync(self):
+        self.assertTrue(CalendarBackfill.is_backfill_needed(GoogleCalendar()))
+        self.assertFalse(CalendarBackfill.is_backfill_needed(GoogleCalendar(sync_detail={
+            GoogleCalendar.KV_SYNC_STATE_KEY: GoogleCalendar.KV_SYNC_STATE_VAL_INITIALIZED,
+            GoogleCalendar.KEY_SYNC_TOKEN: 'token',
+        })))
+
+
+class CalendarHistorySyncTest(SimpleTestCase):
+    def _get_calendar(self, extra_info):
+        return GoogleCalendar(sync_user=User(client=AttentClient(extra_info=extra_info)))
+
+    def test_initial_sync_starts_at_the_horizon(self):
+        calendar = self._get_calendar({CalendarSyncer.SETTING_HORIZON_MONTHS: 3})
+
+        with patch('django.utils.timezone.now', return_value=datetime(2017, 11, 20, tzinfo=dt_timezone.utc)):
+            time_min = CalendarSyncer.get_initial_time_min(calendar)
+
+        self.assertEqual(time_min, '2017-08-01T00:00:00+00:00')
+
+    def test_initial_sync_without_horizon_covers_all_history(self):
+        calendar = self._get_calendar({})
+
+        self.assertEqual(CalendarSyncer.get_initial_time_min(calendar), CalendarSyncer.CAL_EVENT_TIME_MIN)
+        self.assertIsNone(CalendarHistorySync.get_initial_state(calendar, CalendarSyncer.CAL_EVENT_TIME_MIN))
+
+    def test_history_before_the_horizon_is_pending(self):
+        calendar = self._get_calendar({CalendarSyncer.SETTING_HORIZON_MONTHS: 3})
+        calendar.history_sync_detail = CalendarHistorySync.get_initial_state(calendar, '2017-08-01T00:00:00+00:00')
+
+        self.assertEqual(calendar.history_sync_detail[CalendarHistorySync.KEY_TIME_MAX], '2017-08-01T00:00:00+00:00')
+        self.assertTrue(CalendarHistorySync.is_pending(calendar))
+
+        calendar.history_sync_detail = dict(calendar.history_sync_detail, **{CalendarHistorySync.KEY_IS_DONE: True})
+        self.assertFalse(CalendarHistorySync.is_pending(calendar))
+
+
+class CalendarFreeBusySyncerTest(TestCase):
+    def _at(self, hour):
+        return datetime(2017, 11, 2, hour, tzinfo=dt_timezone.utc)
+
+    def test_blocks_split_by_query_windows_are_merged(self):
+        blocks = CalendarFreeBusySyncer.merge_blocks([(self._at(12), self._at(13)),
+                                                      (self._at(10), self._at(11)),
+                                                      (self._at(11), self._at(12))])
+
+        self.assertEqual(blocks, [(self._at(10), self._at(13))])
+
+    def test_unchanged_blocks_are_kept(self):
+        calendar = mommy.make(GoogleCalendar, email_address='rep@something.com', is_kept_in_free_busy_sync=True)
+        time_min, time_max = self._at(0), self._at(23)
+
+        CalendarFreeBusySyncer.save_busy_blocks(calendar, [(self._at(9), self._at(10)), (self._at(14), self._at(15))],
+                                                time_min, time_max)
+        kept_block = GoogleCalendarBusyBlock.objects.get(start=self._at(9))
+
+        CalendarFreeBusySyncer.save_busy_blocks(calendar, [(self._at(9), self._at(10)), (self._at(16), self._at(17))],
+                                                time_min, time_max)
+
+        self.assertEqual(sorted(calendar.busy_blocks.values_list('start', flat=True)), [self._at(9), self._at(16)])
+        self.assertTrue(GoogleCalendarBusyBlock.objects.filter(id=kept_block.id).exists())
+
+    def test_block_starting_at_time_min_is_kept(self):
+        calendar = mommy.make(GoogleCalendar, email_address='rep@something.com', is_kept_in_free_busy_sync=True)
+
+        CalendarFreeBusySyncer.save_busy_blocks(calendar, [(self._at(0), self._at(1))], self._at(0), self._at(23))
+
+        self.assertEqual(list(calendar.busy_blocks.values_list('start', flat=True)), [self._at(0)])
+
+    def test_block_clipped_at_time_min_is_not_stored_again(self):
+        calendar = mommy.make(GoogleCalendar, email_address='rep@something.com', is_kept_in_free_busy_sync=True)
+        mommy.make(GoogleCalendarBusyBlock, calendar=calendar, start=self._at(0) - timedelta(hours=1), end=self._at(1))
+
+        CalendarFreeBusySyncer.save_busy_blocks(calendar, [(self._at(0), self._at(1))], self._at(0), self._at(23))
+
+        self.assertEqual(calendar.busy_blocks.count(), 1)
@@ -0,0 +1,115 @@
+import django_rq
+from django.utils import timezone
+
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarWatchChannel
+from core.sync_engine.api_log_writer import BufferedApiLogWriter
+from core.sync_engine.google_calendar_syncer import CalendarHistorySync, CalendarStorage, CalendarSyncer
+from scripts.google_calendar.transform_google_calendar_event import client_partitions_lock, transform_saved_events
+
+RESOURCE_STATE_SYNC = 'sync'        # first message of a channel, it doesn't carry a change
+
+HISTORY_QUEUE_NAME = 'low'          # history fill must not hold back the recent events of other calendars
+HISTORY_JOB_TIMEOUT = 3 * 60 * 60   # seconds
+
+
+def sync_calendar_events(google_calendar_id):
+    """
+    Incremental event sync of a single calendar, run by the RQ worker. The changed events are transformed
+    right away, unless the client's event transform is running elsewhere; then they are left in the outbox.
+    """
+    calendar = GoogleCalendar.objects.select_related('sync_user__client').get(id=google_calendar_id)
+
+    if not calendar.is_kept_in_sync:
+        return
+
+    log_writer = BufferedApiLogWriter()
+    changed_event_pks = set()
+
+    try:
+        storage = CalendarStorage(log_writer.log, on_events_saved=changed_event_pks.update)
+        CalendarSyncer(user=calendar.sync_user, storage=storage).sync_calendar_events(calendar)
+    finally:
+        log_writer.close()
+
+    if len(changed_event_pks) == 0:
+        return
+
+    with client_partitions_lock(calendar.sync_user.client_id) as is_acquired:
+        if is_acquired:
+            transform_saved_events(changed_event_pks)
+
+
+def enqueue_calendar_events_sync(google_calendar_id):
+    """
+    Notifications come in bursts; a calendar waiting in the queue is not enqueued again
+    """
+    queue = django_rq.get_queue('default')
+    job_id = 'google-calendar-events-sync-{}'.format(google_calendar_id)
+
+    job = queue.fetch_job(job_id)
+    if job is not None and job.get_status() == 'queued':
+        return job
+
+    return queue.enqueue_call(func=sync_calendar_events, args=(google_calendar_id, ), job_id=job_id)
+
+
+def sync_calendar_history(google_calendar_id):
+    """
+    Fills the events older than the client's sync horizon, run by the RQ worker.
+    An interrupted job continues from the last stored page when it is enqueued again.
+    """
+    calendar = GoogleCalendar.objects.select_related('sync_user__client').get(id=google_calendar_id)
+
+    if not calendar.is_kept_in_sync or not CalendarHistorySync.is_pending(calendar):
+        return
+
+    log_writer = BufferedApiLogWriter()
+
+    try:
+        CalendarHistorySync(calendar, CalendarStorage(log_writer.log)).run()
+    finally:
+        log_writer.close()
+
+
+def enqueue_calendar_history_sync(google_calendar_id):
+    queue = django_rq.get_queue(HISTORY_QUEUE_NAME)
+    job_id = 'google-calendar-history-sync-{}'.format(google_calendar_id)
+
+    job = queue.fetch_job(job_id)
+    if job is not None and job.get_status() in ('queued', 'started'):
+        return job
+
+    return queue.enqueue_call(func=sync_calendar_history,
+                              args=(google_calendar_id, ),
+                              timeout=HISTORY_JOB_TIMEOUT,
+                              job_id=job_id)
+
+
+def enqueue_pending_history_syncs(app_client):
+    calendars = GoogleCalendar.objects.filter(sync_user__client=app_client, is_kept_in_sync=True)\
+        .exclude(history_sync_detail={})
+
+    for calendar in calendars:
+        if CalendarHistorySync.is_pending(calendar):
+            enqueue_calendar_history_sync(calendar.id)
+
+
+def handle_channel_notification(channel_id, token, resource_state):
+    """
+    :return: False if the notification doesn't belong to a known channel
+    """
+    try:
+        channel = GoogleCalendarWatchChannel.objects.get(channel_id=channel_id)
+    except GoogleCalendarWatchChannel.DoesNotExist:
+        return False
+
+    if channel.token != token:
+        return False
+
+    channel.last_notification_datetime = timezone.now()
+    channel.save(update_fields=['last_notification_datetime', 'db_updated_at'])
+
+    if resource_state != RESOURCE_STATE_SYNC:
+        enqueue_calendar_events_sync(channel.calendar_id)
+
+    return True
@@ -1,2 +1,4 @@
 class OAuth2UserNotAvailable(Exception):
-    pass
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
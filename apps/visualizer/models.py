@@ -14,6 +14,7 @@ from email_split import email_split
 
 from core.email_domains import is_email_address_in_domain
 from core.email_domains import is_email_address_personal
+from core.email_domains import classify_email_addresses
 from core.mixins import TimeStampedMixin
 from . import exceptions
 from datetime import datetime
@@ -56,6 +57,18 @@ class Client(TimeStampedMixin):
     def is_email_address_in_domain(self, email_address: str):
         return is_email_address_in_domain(email_address, self.email_domain)
 
+    def classify_email_addresses(self, email_addresses):
+        return classify_email_addresses(email_addresses, self.email_domain)
+
+    def get_setting(self, key, default=None):
+        """
+        Client specific settings (e.g. sync tuning) are kept in `extra_info`
+        :param key: name of the setting, e.g. `SyncEnvironment.SETTING_CONCURRENCY`
+        :param default: returned when the setting is not defined for the client
+        :return: value of the setting
+        """
+        return self.extra_info.get(key, default)
+
     def __str__(self):
         return '%s (%s)' % (self.name, self.email_domain)
 
@@ -163,11 +176,11 @@ def set_client_of_user(sender, instance, **kwargs):
     if user.client:
         return
 
-    email = email_split(user.email)
-
-    if is_email_address_personal(email.domain):     # admin user may be from a personal domain
+    if is_email_address_personal(user.email):     # admin user may be from a personal domain
         return
 
+    email = email_split(user.email)
+
     client, _ = Client.objects.get_or_create(email_domain=email.domain)
     user.client = client
     user.save()
@@ -1,10 +1,11 @@
 from bs4 import BeautifulSoup
 from django.core.urlresolvers import reverse
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client
 from django.test.client import RequestFactory
 from unittest.mock import Mock
 from model_mommy import mommy
 
+from core.email_domains import classify_email_addresses, is_email_address_in_domain, is_email_address_personal
 from .models import User, Client as AttentClient, PeriscopeDashboard
 
 from .views import index
@@ -112,3 +113,33 @@ class VisualizerViewsTest(TestCase):
 
 class PeriscopeDashboardModelTest(TestCase):
     pass
+
+
+class EmailDomainTest(SimpleTestCase):
+    def test_personal_domains_and_their_subdomains(self):
+        self.assertTrue(is_email_address_personal('someone@gmail.com'))
+        self.assertTrue(is_email_address_personal('Someone@Mail.Yahoo.com'))
+        self.assertFalse(is_email_address_personal('someone@something.com'))
+        self.assertFalse(is_email_address_personal('someone@co.uk'))
+
+    def test_email_address_in_domain(self):
+        self.assertTrue(is_email_address_in_domain('Rep@Something.com', 'something.com'))
+        self.assertFalse(is_email_address_in_domain('rep@sales.something.com', 'something.com'))
+
+    def test_attendees_are_classified_in_batch(self):
+        email_classes = classify_email_addresses(['rep@something.com', 'buyer@prospect.com', 'buyer@hotmail.com'],
+                                                 'something.com')
+
+        self.assertEqual(email_classes, {'rep@something.com': 'Internal',
+                                         'buyer@prospect.com': 'Business',
+                                         'buyer@hotmail.com': 'Personal'})
+
+
+class SetClientOfUserTest(TestCase):
+    def test_user_of_a_personal_domain_gets_no_client(self):
+        user = mommy.make(User, email='admin@gmail.com')
+        self.assertIsNone(user.client)
+
+    def test_user_of_a_business_domain_gets_the_client_of_the_domain(self):
+        user = mommy.make(User, email='rep@something.com')
+        self.assertEqual(user.client.email_domain, 'something.com')
@@ -9,6 +9,7 @@ from apps.salesforce.authentication import salesforce_connect_url, salesforce_ex
 from ears.env_variables import SLACK_VERIFICATION_TOKEN, SLACK_ATTENT_BOT_CLIENT_ID
 
 import django_rq
+from apps.google_calendar.works import handle_channel_notification
 from apps.slack.works import answer_slack_question
 import json
 
@@ -157,6 +158,18 @@ def slack_selection(request):
     return HttpResponse("Working on {}...".format(text))
 
 
+@csrf_exempt
+def google_calendar_notification(request):
+    is_known_channel = handle_channel_notification(channel_id=request.META.get('HTTP_X_GOOG_CHANNEL_ID'),
+                                                   token=request.META.get('HTTP_X_GOOG_CHANNEL_TOKEN'),
+                                                   resource_state=request.META.get('HTTP_X_GOOG_RESOURCE_STATE'))
+
+    if not is_known_channel:
+        return HttpResponse("Unknown Channel", status=404)
+
+    return HttpResponse("OK")
+
+
 def sample_chart(request):
     import pygal
 
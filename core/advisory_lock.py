@@ -0,0 +1,30 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+LOCK_NAMESPACE_EVENT_TRANSFORM = 1     # first key of the locks, so unrelated locks can't collide
+LOCK_NAMESPACE_CALENDAR_SYNC = 2
+
+
+@contextmanager
+def advisory_lock(namespace, key):
+    """
+    Session level Postgres advisory lock, taken without waiting. It is held across transactions
+    and released when the block is left (or the database session ends)
+
+        with advisory_lock(LOCK_NAMESPACE_EVENT_TRANSFORM, partition_key) as is_acquired:
+            if is_acquired:
+                ...
+
+    :return: context manager giving whether the lock is acquired
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [namespace, key])
+        is_acquired = cursor.fetchone()[0]
+
+    try:
+        yield is_acquired
+    finally:
+        if is_acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [namespace, key])
@@ -1,18 +1,68 @@
-from email_split import email_split
+import os
+from functools import lru_cache
 
-personal_email_domains = [
-    "gmail.com", "yahoo.com", "yahoo.co.in", "aol.com", "att.net", "comcast.net",
-    "facebook.com", "gmail.com", "gmx.com", "googlemail.com", "google.com", "hotmail.com", "hotmail.co.uk",
-    "mac.com", "me.com", "mail.com", "msn.com", "live.com", "sbcglobal.net", "verizon.net", "yahoo.com",
-    "yahoo.co.uk", "rediif.com"
-]
+PERSONAL_EMAIL_DOMAINS_FILE = os.path.join(os.path.dirname(__file__), 'personal_email_domains.txt')
+
+EMAIL_CLASS_INTERNAL = 'Internal'       # in the client's domain
+EMAIL_CLASS_PERSONAL = 'Personal'       # free-mail/ISP address of a person
+EMAIL_CLASS_BUSINESS = 'Business'       # address of another company
+
+
+@lru_cache(maxsize=None)
+def get_personal_email_domains():
+    """
+    The registry is read once, on first use
+    :return: frozenset of the personal email domains
+    """
+    with open(PERSONAL_EMAIL_DOMAINS_FILE) as domains_file:
+        return frozenset(line.strip().lower() for line in domains_file
+                         if line.strip() and not line.startswith('#'))
+
+
+@lru_cache(maxsize=100000)
+def get_email_domain(email_address):
+    """
+    :return: lower-cased domain of the address, '' if there is none
+    """
+    _, _, domain = (email_address or '').rpartition('@')
+    return domain.strip().lower()
+
+
+@lru_cache(maxsize=100000)
+def is_domain_personal(domain):
+    """
+    A subdomain of a personal domain (e.g. mail.yahoo.com) is personal, too
+    """
+    personal_email_domains = get_personal_email_domains()
+    labels = domain.split('.')
+    return any('.'.join(labels[index:]) in personal_email_domains for index in range(len(labels) - 1))
 
 
 def is_email_address_in_domain(email_address, email_domain):
-    email = email_split(email_address)
-    return email.domain == email_domain
+    return get_email_domain(email_address) == email_domain.lower()
 
 
 def is_email_address_personal(email_address):
-    email = email_split(email_address)
-    return email.domain in personal_email_domains
+    return is_domain_personal(get_email_domain(email_address))
+
+
+def classify_email_addresses(email_addresses, email_domain):
+    """
+    Classifies a list of addresses (e.g. the attendees of an event) in one go
+    :param email_domain: domain of the client, its addresses are internal
+    :return: dict of email address -> one of EMAIL_CLASS_INTERNAL, EMAIL_CLASS_PERSONAL, EMAIL_CLASS_BUSINESS
+    """
+    email_domain = email_domain.lower()
+    email_classes = {}
+
+    for email_address in email_addresses:
+        domain = get_email_domain(email_address)
+
+        if domain == email_domain:
+            email_classes[email_address] = EMAIL_CLASS_INTERNAL
+        elif is_domain_personal(domain):
+            email_classes[email_address] = EMAIL_CLASS_PERSONAL
+        else:
+            email_classes[email_address] = EMAIL_CLASS_BUSINESS
+
+    return email_classes
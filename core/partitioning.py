@@ -0,0 +1,153 @@
+"""
+Monthly range partitioning (on `db_created_at`) for append-only log tables.
+
+Partitions are named `<table>_pYYYYMM`. Retention is applied by dropping whole partitions,
+which avoids the DELETE + VACUUM cost on the primary database.
+Requires PostgreSQL 10+ (declarative partitioning); a default partition is added on 11+.
+"""
+import datetime
+
+
+def add_months(month: datetime.date, count):
+    month_index = month.year * 12 + month.month - 1 + count
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+
+class MonthlyPartitionedTable:
+    PARTITION_NAME_FORMAT = '{table}_p{year:04d}{month:02d}'
+
+    def __init__(self, table_name, partition_column='db_created_at', indexed_columns=()):
+        self.table_name = table_name
+        self.partition_column = partition_column
+        self.indexed_columns = indexed_columns
+
+    def get_partition_name(self, month: datetime.date):
+        return self.PARTITION_NAME_FORMAT.format(table=self.table_name, year=month.year, month=month.month)
+
+    def is_partitioned(self, cursor):
+        cursor.execute("SELECT c.relkind FROM pg_class c WHERE c.relname = %s "
+                       "AND pg_table_is_visible(c.oid)", [self.table_name])
+        row = cursor.fetchone()
+        return row is not None and row[0] == 'p'
+
+    def get_partitions(self, cursor):
+        """
+        :return: dict of partition name to its month, the default partition is not included
+        """
+        cursor.execute("SELECT child.relname FROM pg_inherits "
+                       "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                       "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                       "WHERE parent.relname = %s", [self.table_name])
+
+        partitions = {}
+        prefix = '{}_p'.format(self.table_name)
+
+        for (name, ) in cursor.fetchall():
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+                partitions[name] = datetime.date(int(suffix[:4]), int(suffix[4:]), 1)
+
+        return partitions
+
+    def get_default_partition_name(self):
+        return '{}_pdefault'.format(self.table_name)
+
+    def create_partitions(self, cursor, first_month: datetime.date, last_month: datetime.date):
+        """
+        Rows of a month that landed in the default partition (no partition was created in time)
+        are moved into the month's new partition, otherwise the partition couldn't be attached
+        """
+        existing_partitions = self.get_partitions(cursor)
+        created = []
+
+        cursor.execute("SELECT to_regclass(%s)", [self.get_default_partition_name()])
+        (default_partition, ) = cursor.fetchone()
+
+        month = month_start(first_month)
+        while month <= last_month:
+            name = self.get_partition_name(month)
+
+            if name not in existing_partitions:
+                cursor.execute("CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"
+                               .format(name=name, table=self.table_name))
+
+                if default_partition is not None:
+                    cursor.execute("WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s "
+                                   "RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                                   .format(default=self.get_default_partition_name(),
+                                           column=self.partition_column, name=name),
+                                   [month, add_months(month, 1)])
+
+                cursor.execute("ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)"
+                               .format(name=name, table=self.table_name),
+                               [month, add_months(month, 1)])
+                self._add_partition_indexes(cursor, name)
+                created.append(name)
+
+            month = add_months(month, 1)
+
+        return created
+
+    def create_default_partition(self, cursor):
+        if cursor.connection.server_version < 110000:
+            return None
+
+        name = self.get_default_partition_name()
+        cursor.execute("CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} DEFAULT"
+                       .format(name=name, table=self.table_name))
+        self._add_partition_indexes(cursor, name)
+        return name
+
+    def drop_partitions_before(self, cursor, month: datetime.date):
+        dropped = []
+
+        for name, partition_month in sorted(self.get_partitions(cursor).items()):
+            if partition_month < month:
+                cursor.execute("DROP TABLE {name}".format(name=name))
+                dropped.append(name)
+
+        return dropped
+
+    def convert(self, cursor, months_ahead):
+        """
+        Turns the existing plain table into a partitioned one and moves its rows into the partitions.
+        Foreign key constraints are not kept (PostgreSQL 10 doesn't support them on partitioned tables).
+        Must run in a transaction.
+        """
+        legacy_table = '{}_unpartitioned'.format(self.table_name)
+
+        cursor.execute("LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE".format(table=self.table_name))
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [self.table_name])
+        (sequence_name, ) = cursor.fetchone()
+
+        cursor.execute("ALTER TABLE {table} RENAME TO {legacy}".format(table=self.table_name, legacy=legacy_table))
+        cursor.execute("CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})"
+                       .format(table=self.table_name, legacy=legacy_table, column=self.partition_column))
+
+        cursor.execute("SELECT MIN({column}) FROM {legacy}".format(column=self.partition_column, legacy=legacy_table))
+        (oldest, ) = cursor.fetchone()
+
+        current_month = month_start(datetime.date.today())
+        first_month = month_start(oldest) if oldest else current_month
+
+        self.create_partitions(cursor, first_month, add_months(current_month, months_ahead))
+        self.create_default_partition(cursor)
+
+        cursor.execute("INSERT INTO {table} SELECT * FROM {legacy}".format(table=self.table_name,
+                                                                          legacy=legacy_table))
+        cursor.execute("ALTER SEQUENCE {sequence} OWNED BY {table}.id".format(sequence=sequence_name,
+                                                                              table=self.table_name))
+        cursor.execute("DROP TABLE {legacy}".format(legacy=legacy_table))
+
+    def _add_partition_indexes(self, cursor, partition_name):
+        cursor.execute("ALTER TABLE {name} ADD PRIMARY KEY (id)".format(name=partition_name))
+        cursor.execute("CREATE INDEX {name}_{column}_idx ON {name} ({column})"
+                       .format(name=partition_name, column=self.partition_column))
+
+        for column in self.indexed_columns:
+            cursor.execute("CREATE INDEX {name}_{column}_idx ON {name} ({column})"
+                           .format(name=partition_name, column=column))
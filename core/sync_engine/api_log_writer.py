@@ -0,0 +1,127 @@
+import hashlib
+import json
+import queue
+import threading
+from random import random
+
+from django.conf import settings
+from django.db import connection
+
+from apps.google_calendar.models import GoogleCalendarApiLogs
+
+
+class BufferedApiLogWriter:
+    """ Drop-in replacement of `GoogleCalendarApiLogs.log` that keeps logging cheap
+
+    * Successful responses are sampled (`SAMPLE_RATE`) and stored as a summary:
+      item count, page/sync tokens, SHA-1 of the full body and the first `KEPT_ITEM_COUNT` items.
+    * Error responses (the ones with `ERROR_STATUS_KEY`) are always stored in full.
+    * Rows are inserted from a background thread with `bulk_create`, `BATCH_SIZE` rows at a time
+      or every `FLUSH_INTERVAL` seconds.
+
+    `close()` must be called to write the buffered rows at the end of a sync.
+    """
+
+    ERROR_STATUS_KEY = 'statusCode'
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, sample_rate=None, batch_size=None, flush_interval=None, kept_item_count=None):
+        config = getattr(settings, 'GOOGLE_CALENDAR_API_LOG', {})
+
+        self._sample_rate = config.get('SAMPLE_RATE', 1.0) if sample_rate is None else sample_rate
+        self._batch_size = config.get('BATCH_SIZE', 100) if batch_size is None else batch_size
+        self._flush_interval = config.get('FLUSH_INTERVAL', 5) if flush_interval is None else flush_interval
+        self._kept_item_count = config.get('KEPT_ITEM_COUNT', 0) if kept_item_count is None else kept_item_count
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def log(self, email_address, resource, args, response):
+        is_error = self.ERROR_STATUS_KEY in response
+
+        if not is_error and random() >= self._sample_rate:
+            return
+
+        entry = GoogleCalendarApiLogs(user_email_address=email_address,
+                                      resource=resource,
+                                      args=args,
+                                      response=response if is_error else self.summarize_response(response))
+        self._start_thread_if_needed()
+        self._queue.put(entry)
+
+    def summarize_response(self, response):
+        body = json.dumps(response, sort_keys=True).encode('utf-8')
+        items = response.get('items', [])
+
+        summary = {key: value for key, value in response.items() if key != 'items'}
+        summary['itemCount'] = len(items)
+        summary['sha1'] = hashlib.sha1(body).hexdigest()
+
+        if self._kept_item_count > 0:
+            summary['items'] = items[:self._kept_item_count]
+
+        return summary
+
+    def flush(self):
+        """ Blocks until all the logged rows are written """
+        if self._thread is None:
+            return
+        self._queue.put(self._FLUSH)
+        self._queue.join()
+
+    def close(self):
+        with self._thread_lock:
+            if self._thread is None:
+                return
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _start_thread_if_needed(self):
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def _write_loop(self):
+        buffer = []
+
+        try:
+            while True:
+                try:
+                    entry = self._queue.get(timeout=self._flush_interval)
+                except queue.Empty:
+                    self._write(buffer)
+                    continue
+
+                if entry is self._STOP:
+                    self._write(buffer)
+                    self._queue.task_done()
+                    break
+
+                if entry is self._FLUSH:
+                    self._write(buffer)
+                elif entry is not None:
+                    buffer.append(entry)
+                    if len(buffer) >= self._batch_size:
+                        self._write(buffer)
+
+                self._queue.task_done()
+        finally:
+            connection.close()      # the thread's own database connection
+
+    @staticmethod
+    def _write(buffer):
+        if len(buffer) < 1:
+            return
+
+        try:
+            GoogleCalendarApiLogs.objects.bulk_create(buffer)
+        except Exception as exc:
+            print("API logs couldn't be written: {}".format(exc))
+
+        buffer.clear()
@@ -0,0 +1,81 @@
+import datetime
+import uuid
+
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarWatchChannel
+from apps.visualizer.models import Client
+from core.sync_engine.google_calendar_syncer import CalendarStorage, CalendarSyncer
+
+
+class CalendarChannelManager:
+    """ Keeps a push notification channel open for every calendar kept in sync
+
+    Channels expire (Google decides the expiration), so a channel expiring within
+    `RENEWAL_WINDOW` is replaced by a new one and then stopped.
+    Channels of calendars that are not kept in sync anymore are stopped.
+    """
+
+    RENEWAL_WINDOW = datetime.timedelta(hours=24)
+
+    def __init__(self, app_client: Client, address):
+        self._client = app_client
+        self._address = address
+        self._storage = CalendarStorage(lambda **kwargs: None)
+        self._syncers = {}
+
+    def _get_syncer(self, calendar: GoogleCalendar):
+        user = calendar.sync_user
+        if user.id not in self._syncers:
+            self._syncers[user.id] = CalendarSyncer(user=user, storage=self._storage)
+        return self._syncers[user.id]
+
+    def renew_channels(self):
+        renewal_limit = timezone.now() + self.RENEWAL_WINDOW
+
+        for calendar in self._storage.get_calendars(self._client):
+            channels = list(calendar.watch_channels.all())
+
+            if any(channel.expiration > renewal_limit for channel in channels):
+                continue
+
+            try:
+                self.open_channel(calendar)
+            except HttpError as exception:
+                print("Channel couldn't be opened for {}: {}".format(calendar.email_address, exception))
+                continue
+
+            for channel in channels:
+                self.close_channel(channel)
+
+        channels_to_close = GoogleCalendarWatchChannel.objects\
+            .filter(calendar__sync_user__client=self._client, calendar__is_kept_in_sync=False)\
+            .select_related('calendar__sync_user')
+
+        for channel in channels_to_close:
+            self.close_channel(channel)
+
+    def open_channel(self, calendar: GoogleCalendar):
+        channel_id = str(uuid.uuid4())
+        token = uuid.uuid4().hex
+
+        response = self._get_syncer(calendar).watch_calendar_events(calendar, channel_id, token, self._address)
+        expiration = datetime.datetime.fromtimestamp(int(response['expiration']) / 1000, tz=datetime.timezone.utc)
+
+        print("Channel is opened for {} until {}".format(calendar.email_address, expiration))
+
+        return GoogleCalendarWatchChannel.objects.create(calendar=calendar,
+                                                         channel_id=channel_id,
+                                                         resource_id=response.get('resourceId', ''),
+                                                         token=token,
+                                                         expiration=expiration)
+
+    def close_channel(self, channel: GoogleCalendarWatchChannel):
+        if channel.expiration > timezone.now():
+            try:
+                self._get_syncer(channel.calendar).stop_channel(channel.channel_id, channel.resource_id)
+            except HttpError as exception:
+                print("Channel {} couldn't be stopped: {}".format(channel.channel_id, exception))
+
+        channel.delete()
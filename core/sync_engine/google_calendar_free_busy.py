@@ -0,0 +1,149 @@
+import datetime
+import json
+
+from django.db import transaction
+from django.utils import dateparse
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarBusyBlock
+from apps.visualizer.models import Client, User
+from core.sync_engine.api_log_writer import BufferedApiLogWriter
+from core.sync_engine.google_calendar_syncer import CalendarConnector, CalendarStorage
+
+
+class CalendarFreeBusySyncer:
+    """ Free/busy mode for the calendars whose events can't be read (`freeBusyReader` access)
+
+    Instead of events, the busy time blocks of up to `QUERY_CALENDAR_COUNT` calendars are asked
+    in a single freebusy query, for the range from `PAST` ago to `FUTURE` ahead.
+    The stored blocks of the range are reconciled with the fetched ones, so unchanged blocks are kept.
+    Blocks starting before the range are history and are never touched.
+    """
+
+    SETTING_ENABLED = 'calendar_sync_free_busy'
+
+    QUERY_CALENDAR_COUNT = 50       # upper limit of the API
+    QUERY_WINDOW = datetime.timedelta(days=30)
+    PAST = datetime.timedelta(days=30)
+    FUTURE = datetime.timedelta(days=30)
+
+    def __init__(self, app_client: Client):
+        self._client = app_client
+        self._log_writer = BufferedApiLogWriter()
+        self._storage = CalendarStorage(self._log_writer.log)
+
+    @classmethod
+    def is_enabled(cls, app_client: Client):
+        return bool(app_client.get_setting(cls.SETTING_ENABLED, False))
+
+    def sync(self):
+        try:
+            self._sync()
+        finally:
+            self._log_writer.close()
+
+    def _sync(self):
+        calendars = GoogleCalendar.objects\
+            .filter(sync_user__client=self._client, is_kept_in_free_busy_sync=True)\
+            .select_related('sync_user')
+
+        calendars_by_user = {}
+        for calendar in calendars:
+            calendars_by_user.setdefault(calendar.sync_user, []).append(calendar)
+
+        now = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        time_min, time_max = now - self.PAST, now + self.FUTURE
+
+        for user, user_calendars in calendars_by_user.items():
+            for index in range(0, len(user_calendars), self.QUERY_CALENDAR_COUNT):
+                self._sync_calendars(user, user_calendars[index:index + self.QUERY_CALENDAR_COUNT], time_min, time_max)
+
+    def _sync_calendars(self, user: User, calendars, time_min, time_max):
+        print("Syncing busy blocks of {} calendars, sync user: {}".format(len(calendars), user.email))
+
+        service = CalendarConnector.get_for_user(user).get_service()
+        busy_periods = {calendar.email_address: [] for calendar in calendars}
+        failed_email_addresses = set()
+
+        window_start = time_min
+        while window_start < time_max:
+            window_end = min(window_start + self.QUERY_WINDOW, time_max)
+            body = {
+                'timeMin': window_start.isoformat(),
+                'timeMax': window_end.isoformat(),
+                'items': [{'id': calendar.email_address} for calendar in calendars],
+            }
+
+            try:
+                response = service.freebusy().query(body=body).execute()
+            except HttpError as exception:
+                status_code = exception.resp.status
+                error_msg = json.loads(exception.content)['error']['errors'][0]['message']
+                print("Error: Code ['{}'], Message ['{}']".format(status_code, error_msg))
+                self._storage.log(email_address=user.email,
+                                  resource='freebusy',
+                                  args=body,
+                                  response={'statusCode': status_code, 'errorMsg': error_msg})
+                return
+
+            self._storage.log(email_address=user.email, resource='freebusy', args=body, response=response)
+
+            for email_address, result in response.get('calendars', {}).items():
+                if result.get('errors'):
+                    failed_email_addresses.add(email_address)
+                elif email_address in busy_periods:
+                    busy_periods[email_address].extend(result.get('busy', []))
+
+            window_start = window_end
+
+        for calendar in calendars:
+            if calendar.email_address in failed_email_addresses:
+                continue
+
+            blocks = self.merge_blocks([(dateparse.parse_datetime(period['start']),
+                                         dateparse.parse_datetime(period['end']))
+                                        for period in busy_periods[calendar.email_address]])
+            self.save_busy_blocks(calendar, blocks, time_min, time_max)
+
+    @staticmethod
+    def merge_blocks(blocks):
+        """
+        Blocks split by the query windows (or overlapping) are joined
+        :param blocks: list of (start, end)
+        """
+        merged_blocks = []
+
+        for start, end in sorted(blocks):
+            if merged_blocks and start <= merged_blocks[-1][1]:
+                merged_blocks[-1] = (merged_blocks[-1][0], max(end, merged_blocks[-1][1]))
+            else:
+                merged_blocks.append((start, end))
+
+        return merged_blocks
+
+    @staticmethod
+    def save_busy_blocks(calendar: GoogleCalendar, blocks, time_min, time_max):
+        fetched_blocks = {(start, end) for start, end in blocks if start >= time_min}
+
+        with transaction.atomic():
+            # a block clipped at `time_min` is already stored with its real start
+            if GoogleCalendarBusyBlock.objects.filter(calendar=calendar, start__lt=time_min, end__gt=time_min).exists():
+                fetched_blocks = {(start, end) for start, end in fetched_blocks if start > time_min}
+
+            stored_blocks = {(start, end): block_id for block_id, start, end in
+                             GoogleCalendarBusyBlock.objects
+                             .filter(calendar=calendar, start__gte=time_min, start__lt=time_max)
+                             .values_list('id', 'start', 'end')}
+
+            removed_block_ids = [block_id for block, block_id in stored_blocks.items() if block not in fetched_blocks]
+            if len(removed_block_ids) > 0:
+                GoogleCalendarBusyBlock.objects.filter(id__in=removed_block_ids).delete()
+
+            GoogleCalendarBusyBlock.objects.bulk_create([
+                GoogleCalendarBusyBlock(calendar=calendar, start=start, end=end)
+                for start, end in sorted(fetched_blocks) if (start, end) not in stored_blocks
+            ])
+
+            calendar.last_free_busy_sync_datetime = timezone.now()
+            calendar.save(update_fields=['last_free_busy_sync_datetime', 'db_updated_at'])
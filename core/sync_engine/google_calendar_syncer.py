@@ -1,18 +1,30 @@
 import datetime
 import json
+import queue
 import sys
+import threading
+from collections import OrderedDict
 
 import httplib2
-from apiclient import discovery
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from googleapiclient.errors import HttpError
 from oauth2client import client
+from psqlextra.query import ConflictAction
 
-from apps.google_calendar.models import GoogleCalendarListSyncState, GoogleCalendar, GoogleCalendarApiLogs, \
-    GoogleCalendarEvent
+from apps.google_calendar.models import GoogleCalendarListSyncState, GoogleCalendar, GoogleCalendarEvent, \
+    GoogleCalendarEventMembership, GoogleCalendarRecurringSeries, GoogleCalendarAccess, GoogleCalendarEventChange
+from apps.visualizer.exceptions import OAuth2UserNotAvailable
 from apps.visualizer.models import User, Client
 from ears.env_variables import GOOGLE_OAUTH2_KEY, GOOGLE_OAUTH2_SECRET
 from ears.auth_settings import GOOGLE_TOKEN_URI
+from core.advisory_lock import advisory_lock, LOCK_NAMESPACE_CALENDAR_SYNC
+from core.sync_engine.api_log_writer import BufferedApiLogWriter
+from core.sync_engine.google_discovery import build_service
+from core.sync_engine.quota import GoogleApiQuota, RateLimitedHttp
+from core.sync_engine.scheduler import AdaptiveSyncScheduler
 
 
 class RetrySync(Exception):
@@ -21,12 +33,33 @@ class RetrySync(Exception):
 
 
 class CalendarConnector:  # Google API connection for a given User
+    _thread_connectors = threading.local()
+
     def __init__(self, user: User):
         oauth2_user = user.get_google_oauth2_user()
-        self._service = self._setup_client(oauth2_user)
+        self._http = self._setup_http(oauth2_user, user)
+        self._service = build_service('calendar', 'v3', http=self._http)
+
+    @classmethod
+    def get_for_user(cls, user: User):
+        """
+        Connectors are reused within a thread (`httplib2.Http` can't be shared across threads)
+        as long as the user's authorization doesn't change
+        """
+        connectors = getattr(cls._thread_connectors, 'connectors', None)
+        if connectors is None:
+            connectors = cls._thread_connectors.connectors = {}
+
+        auth_details = user.get_google_oauth2_user().extra_data
+        key = (user.id, auth_details.get('refresh_token'))
+
+        if key not in connectors:
+            connectors[key] = cls(user=user)
+
+        return connectors[key]
 
     @staticmethod
-    def _setup_client(oauth2_user):
+    def _setup_http(oauth2_user, user: User):
         auth_details = oauth2_user.extra_data
 
         credentials = client.OAuth2Credentials(
@@ -38,19 +71,76 @@ class CalendarConnector:  # Google API connection for a given User
                 auth_details['auth_time'] + auth_details['expires']
             ),
             token_uri=GOOGLE_TOKEN_URI,
-            user_agent='attent-user-agent/1.0',
+            user_agent='attent-user-agent/1.0 (gzip)',     # Google APIs serve gzip'ed responses to "gzip" agents
         )
 
         http = credentials.authorize(httplib2.Http())
-        return discovery.build('calendar', 'v3', http=http)
+
+        if not getattr(settings, 'GOOGLE_API_QUOTA', {}).get('ENABLED', False):
+            return http
+
+        return RateLimitedHttp(http, quota=GoogleApiQuota(), user_id=user.id)
+
+    def acquire_quota(self, count):
+        """
+        Takes quota for requests that aren't sent one by one (e.g. calls in a batch request)
+        """
+        if isinstance(self._http, RateLimitedHttp) and count > 0:
+            self._http.acquire(count)
 
     def get_service(self):
         return self._service
 
 
+class CalendarReaderPool:
+    """ Users whose credentials can read the events of a calendar
+
+    Event fetches are spread across all the users having the calendar in their calendar list
+    (`GoogleCalendarAccess`) instead of going through the calendar's single `sync_user`. A user whose
+    quota is exhausted or whose token can't be refreshed is left out for the rest of the sync,
+    and the request fails over to the next reader.
+    """
+
+    def __init__(self):
+        self._unavailable_user_ids = set()
+        self._lock = threading.Lock()
+
+    def get_readers(self, calendar: GoogleCalendar):
+        """
+        :return: available readers, starting at a different one for each calendar
+        """
+        users = {access.user_id: access.user for access in calendar.accesses.all() if access.is_reader()}
+        users.setdefault(calendar.sync_user_id, calendar.sync_user)
+
+        readers = [users[user_id] for user_id in sorted(users.keys()) if user_id not in self._unavailable_user_ids]
+
+        if len(readers) == 0:
+            return [calendar.sync_user]     # the last resort, as before the pool
+
+        offset = calendar.id % len(readers)
+        return readers[offset:] + readers[:offset]
+
+    def mark_unavailable(self, user: User, exception):
+        print("Sync user {} is left out: {}".format(user.email, exception))
+        with self._lock:
+            self._unavailable_user_ids.add(user.id)
+
+    @staticmethod
+    def is_failover_error(exception):
+        if isinstance(exception, HttpError):
+            return GoogleApiQuota.is_rate_limit_response(exception.resp, exception.content)
+
+        return isinstance(exception, (client.HttpAccessTokenRefreshError, OAuth2UserNotAvailable))
+
+
 class CalendarStorage:
-    def __init__(self, logger_fn):
+    def __init__(self, logger_fn, on_events_saved=None):
+        """
+        :param on_events_saved: called with the primary keys of the changed events of each committed page,
+                                e.g. to hand them to the transform without waiting for the whole extract
+        """
         self._logger_fn = logger_fn
+        self._on_events_saved = on_events_saved
 
     @staticmethod
     def get_last_calendar_list_sync_state(user: User):
@@ -68,64 +158,189 @@ class CalendarStorage:
 
     @staticmethod
     def get_calendars(app_client: Client):
-        return GoogleCalendar.objects.filter(sync_user__client=app_client).filter(is_kept_in_sync=True)
+        return GoogleCalendar.objects.filter(sync_user__client=app_client).filter(is_kept_in_sync=True)\
+            .select_related('sync_user__client')\
+            .prefetch_related(Prefetch('accesses', queryset=GoogleCalendarAccess.objects.select_related('user')))
 
     @staticmethod
     def save_calendars(api_response, sync_user: User):
+        """
+        Calendars listed by the user are created with the user as their sync user. The user's access is
+        recorded, then the sync user and the sync mode of each calendar are worked out from the accesses
+        of all the users, so the result doesn't depend on which user listed the calendar last.
+        """
         calendars = api_response.get('items', None)
+
+        if len(calendars) < 1:
+            return
+
+        new_calendar_rows = []
         for cal in calendars:
-            email_address = cal.get('id')
-            timezone = cal.get('timeZone')
+            if cal.get('deleted', False):   # only its access is removed
+                continue
 
             access_role = cal.get('accessRole', 'freeBusyReader')
-            to_be_in_sync = sync_user.client.is_email_address_in_domain(email_address) \
-                and not (access_role == 'freeBusyReader')
-
-            calendar, _ = GoogleCalendar.objects.get_or_create(
-                email_address=email_address,
-                defaults={
-                    'sync_user': sync_user,
-                    'is_kept_in_sync': to_be_in_sync,
-                    'timezone': timezone,
-                    'sync_user_access_role': access_role,
-                }
-            )
-
-            if calendar.sync_user.id != sync_user.id:           # Will this cause flip flops and sync state problems?
-                history_item = {'user_id': calendar.sync_user.id,
+            is_in_domain = sync_user.client.is_email_address_in_domain(cal.get('id'))
+
+            new_calendar_rows.append({
+                'email_address': cal.get('id'),
+                'sync_user': sync_user,
+                'sync_user_history': {},
+                'is_kept_in_sync': is_in_domain and access_role in GoogleCalendarAccess.READER_ROLES,
+                'is_kept_in_free_busy_sync': is_in_domain and access_role == 'freeBusyReader',
+                'timezone': cal.get('timeZone'),
+                'sync_user_access_role': access_role,
+            })
+
+        if len(new_calendar_rows) > 0:
+            GoogleCalendar.objects\
+                .on_conflict(['email_address'], ConflictAction.NOTHING)\
+                .bulk_insert(new_calendar_rows)
+
+        CalendarStorage._save_calendar_accesses(calendars, sync_user)
+        CalendarStorage._update_calendar_sync_modes(calendars, sync_user)
+
+    @staticmethod
+    def _save_calendar_accesses(calendars, sync_user: User):
+        """
+        Every user listing a calendar is recorded, so its events can be fetched with any of their credentials
+        """
+        calendar_pks = dict(GoogleCalendar.objects
+                            .filter(email_address__in=[cal.get('id') for cal in calendars])
+                            .values_list('email_address', 'id'))
+
+        access_rows = {}
+        removed_calendar_pks = []
+
+        for cal in calendars:
+            calendar_pk = calendar_pks.get(cal.get('id'))
+
+            if cal.get('deleted', False):
+                if calendar_pk is not None:     # a calendar never stored has no accesses either
+                    removed_calendar_pks.append(calendar_pk)
+                continue
+
+            access_rows[calendar_pk] = {
+                'calendar_id': calendar_pk,
+                'user': sync_user,
+                'access_role': cal.get('accessRole', 'freeBusyReader'),
+            }
+
+        if len(removed_calendar_pks) > 0:
+            GoogleCalendarAccess.objects.filter(user=sync_user, calendar_id__in=removed_calendar_pks).delete()
+
+        if len(access_rows) > 0:
+            GoogleCalendarAccess.objects\
+                .on_conflict(['calendar', 'user'], ConflictAction.UPDATE)\
+                .bulk_insert(list(access_rows.values()))
+
+    @staticmethod
+    def _update_calendar_sync_modes(calendars, sync_user: User):
+        """
+        Any reader among the users makes the calendar kept in sync, otherwise a user with free/busy access
+        keeps it in free/busy sync. The sync user is replaced only when it has lost its access, or when it
+        can't read the events while another user can.
+        """
+        timezones = {cal.get('id'): cal.get('timeZone') for cal in calendars}
+
+        existing_calendars = list(GoogleCalendar.objects
+                                  .filter(email_address__in=timezones.keys())
+                                  .only('email_address', 'sync_user_id', 'sync_user_history', 'is_kept_in_sync',
+                                        'is_kept_in_free_busy_sync', 'timezone', 'sync_user_access_role'))
+
+        access_roles = {}   # calendar id -> {user id: access role}
+        for calendar_pk, user_id, access_role in GoogleCalendarAccess.objects\
+                .filter(calendar__in=existing_calendars)\
+                .values_list('calendar_id', 'user_id', 'access_role'):
+            access_roles.setdefault(calendar_pk, {})[user_id] = access_role
+
+        calendar_rows = []
+
+        for calendar in existing_calendars:
+            roles = access_roles.get(calendar.id, {})
+            reader_ids = {user_id for user_id, role in roles.items() if role in GoogleCalendarAccess.READER_ROLES}
+            is_in_domain = sync_user.client.is_email_address_in_domain(calendar.email_address)
+
+            sync_user_id = calendar.sync_user_id
+            sync_user_history = calendar.sync_user_history
+
+            if sync_user_id not in roles or (sync_user_id not in reader_ids and len(reader_ids) > 0):
+                candidate_ids = reader_ids or set(roles.keys())
+                if len(candidate_ids) > 0:
+                    sync_user_id = sync_user.id if sync_user.id in candidate_ids else min(candidate_ids)
+
+            if sync_user_id != calendar.sync_user_id:
+                history_item = {'user_id': calendar.sync_user_id,
                                 'end': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-                calendar.sync_user_history['list'] = calendar.sync_user_history.get('list', [])
-                calendar.sync_user_history['list'].append(history_item)
+                sync_user_history['list'] = sync_user_history.get('list', [])
+                sync_user_history['list'].append(history_item)
+
+            calendar_row = {
+                'email_address': calendar.email_address,
+                'sync_user_id': sync_user_id,
+                'sync_user_history': sync_user_history,
+                'is_kept_in_sync': is_in_domain and len(reader_ids) > 0,
+                'is_kept_in_free_busy_sync': is_in_domain and len(reader_ids) == 0 and len(roles) > 0,
+                'timezone': timezones[calendar.email_address] or calendar.timezone,
+                'sync_user_access_role': roles.get(sync_user_id, calendar.sync_user_access_role),
+            }
 
-            calendar.sync_user = sync_user
-            calendar.is_kept_in_sync = to_be_in_sync
-            calendar.timezone = timezone
-            calendar.sync_user_access_role = access_role
-            calendar.save()
+            if any(getattr(calendar, field) != value for field, value in calendar_row.items()):
+                calendar_rows.append(calendar_row)
+
+        if len(calendar_rows) > 0:
+            GoogleCalendar.objects\
+                .on_conflict(['email_address'], ConflictAction.UPDATE)\
+                .bulk_insert(calendar_rows)
+
+    @staticmethod
+    def save_calendars_page(api_response, sync_user: User, sync_detail):
+        """
+        Calendars of a page and the user's new list sync state are committed together
+        """
+        with transaction.atomic():
+            CalendarStorage.save_calendars(api_response, sync_user)
+
+            sync_object = GoogleCalendarListSyncState(user=sync_user)
+            sync_object.sync_detail = sync_detail
+            sync_object.save()
 
     @staticmethod
     def get_last_calendar_sync_state(calendar: GoogleCalendar):
         return calendar.get_last_sync_state()
 
-    # Wrap everything in a transaction to avoid half sync'ed state!
-
     @staticmethod
-    def save_calendar_events(api_response, app_client: Client):
+    def save_calendar_events(api_response, calendar: GoogleCalendar):
+        """
+        Saves a page of events of the calendar. A meeting fetched from the calendars of several attendees
+        is stored once (keyed on `canonical_key`), with one membership per calendar. Cancelled events
+        only leave the calendar, the canonical event is deleted when it is left in no calendar.
+        :return: set of primary keys of the changed events (the ones appended to the outbox)
+        """
+        app_client = calendar.sync_user.client
         event_list = api_response.get('items')
 
+        cancelled_event_ids = set()
+        event_rows = {}
+        canonical_keys = {}     # event id in the calendar -> canonical key
+        master_keys = set()     # canonical keys of the recurring masters
+        instance_event_ids = set()  # event ids of the instances keyed on a `dateTime`, see `_adopt_rekeyed_events`
+
         for event_item in event_list:
+            event_id = event_item.get('id')
 
             event_status = event_item.get('status')
             if event_status == 'cancelled':
-                print("A cancelled event. Will delete if exists: {}".format(event_item.get('id')))
-                try:
-                    event = GoogleCalendarEvent.objects.get(event_id=event_item.get('id'))
-                    event.delete()
-                except GoogleCalendarEvent.DoesNotExist:
-                    pass
+                cancelled_event_ids.add(event_id)
+                canonical_keys.pop(event_id, None)
                 continue
 
-            event_defaults = {
+            canonical_key = GoogleCalendarEvent.get_canonical_key(app_client.id, event_item)
+
+            event_row = {
+                'event_id': event_id,
+                'i_cal_uid': event_item.get('iCalUID', ''),
+                'canonical_key': canonical_key,
                 'attendees': event_item.get('attendees', {}),
                 'created': event_item.get('created', event_item.get('updated')),
                 'creator': event_item.get('creator', {}),
@@ -139,13 +354,357 @@ class CalendarStorage:
                 'updated': event_item.get('updated'),
                 'client': app_client,
                 'status': event_item.get('status'),
+                'recurring_series': None,
+                'inherited_fields': [],
             }
+            event_row['content_hash'] = GoogleCalendarEvent.get_content_hash(event_row)
 
-            if event_defaults.get('updated') is None:
+            if event_row.get('updated') is None:
                 raise Exception("Empty 'updated' field", event_item)
 
-            GoogleCalendarEvent.objects.update_or_create(event_id=event_item.get('id'),
-                                                         defaults=event_defaults)
+            cancelled_event_ids.discard(event_id)
+            event_rows[canonical_key] = event_row   # an event can appear only once in a multi-row upsert
+            canonical_keys[event_id] = canonical_key
+
+            if 'recurrence' in event_item:
+                master_keys.add(canonical_key)
+
+            if 'dateTime' in event_item.get('originalStartTime', {}):
+                instance_event_ids.add(event_id)
+
+        if len(cancelled_event_ids) > 0:
+            print("{} cancelled events. Will delete if exist".format(len(cancelled_event_ids)))
+            CalendarStorage._remove_calendar_events(calendar, cancelled_event_ids)
+
+        if len(event_rows) == 0:
+            return set()
+
+        CalendarStorage._adopt_legacy_events(canonical_keys)
+        rekeyed_event_pks = CalendarStorage._adopt_rekeyed_events(
+            calendar, {event_id: canonical_keys[event_id] for event_id in instance_event_ids
+                       if event_id in canonical_keys})
+
+        event_pks, changed_event_pks = CalendarStorage._save_changed_events(app_client, event_rows, master_keys)
+        CalendarStorage._save_memberships(calendar, canonical_keys, event_pks)
+
+        if len(rekeyed_event_pks) > 0:     # duplicates left in no calendar
+            GoogleCalendarEvent.objects.filter(id__in=rekeyed_event_pks, membership__isnull=True).delete()
+
+        return changed_event_pks
+
+    @staticmethod
+    def _save_changed_events(app_client: Client, event_rows, master_keys):
+        """
+        Events coming back unchanged (e.g. after a resync or an overlapping backfill) have the same
+        `content_hash` as their stored row and are not written again. Changed events are appended to
+        the `GoogleCalendarEventChange` outbox for the transform.
+        :return: tuple of dict of canonical key -> primary key of all the events of the page,
+                 and set of primary keys of the changed events
+        """
+        stored_events = GoogleCalendarEvent.objects\
+            .filter(canonical_key__in=event_rows.keys())\
+            .values_list('canonical_key', 'id', 'content_hash')
+
+        event_pks = {}
+        for canonical_key, event_pk, content_hash in stored_events:
+            if event_rows[canonical_key]['content_hash'] == content_hash:
+                event_pks[canonical_key] = event_pk
+
+        changed_event_rows = {canonical_key: event_row for canonical_key, event_row in event_rows.items()
+                              if canonical_key not in event_pks}
+
+        unchanged_guest_copy_pks = CalendarStorage._merge_guest_copies(changed_event_rows)
+        for canonical_key, event_pk in unchanged_guest_copy_pks.items():
+            event_pks[canonical_key] = event_pk
+            del changed_event_rows[canonical_key]
+
+        if len(changed_event_rows) == 0:
+            return event_pks, set()
+
+        CalendarStorage._apply_recurring_series(app_client, changed_event_rows, master_keys)
+
+        GoogleCalendarEvent.objects\
+            .on_conflict(['canonical_key'], ConflictAction.UPDATE)\
+            .bulk_insert(list(changed_event_rows.values()))
+
+        event_pks.update(GoogleCalendarEvent.objects
+                         .filter(canonical_key__in=changed_event_rows.keys())
+                         .values_list('canonical_key', 'id'))
+
+        changed_event_pks = {event_pks[canonical_key] for canonical_key in changed_event_rows.keys()}
+
+        changed_master_keys = master_keys.intersection(changed_event_rows.keys())
+        if len(changed_master_keys) > 0:    # instances read the content of their series
+            changed_event_pks.update(GoogleCalendarEvent.objects
+                                     .filter(recurring_series__series_key__in=changed_master_keys)
+                                     .values_list('id', flat=True))
+
+        GoogleCalendarEventChange.objects.bulk_create([
+            GoogleCalendarEventChange(client=app_client, google_calendar_event_id=event_pk)
+            for event_pk in sorted(changed_event_pks)
+        ])
+
+        return event_pks, changed_event_pks
+
+    @staticmethod
+    def _merge_guest_copies(event_rows):
+        """
+        Attendees of a shared meeting may not see each other (`guestsCanSeeOtherGuests`), so their copies
+        list fewer attendees than the organizer's. A copy that is not the organizer's doesn't drop the
+        attendees of a stored copy with more of them; the attendees it lists are updated.
+        :return: dict of canonical key -> primary key of the copies with the stored content once merged
+        """
+        guest_copy_keys = [canonical_key for canonical_key, event_row in event_rows.items()
+                           if not event_row['organizer'].get('self', False)]
+        unchanged_event_pks = {}
+
+        if len(guest_copy_keys) == 0:
+            return unchanged_event_pks
+
+        for event in GoogleCalendarEvent.objects.select_related('recurring_series')\
+                .filter(canonical_key__in=guest_copy_keys):
+            event.read_through_series()
+            event_row = event_rows[event.canonical_key]
+
+            if len(event.attendees) <= len(event_row['attendees']):
+                continue
+
+            attendees = OrderedDict((attendee.get('email'), attendee) for attendee in event.attendees)
+            attendees.update((attendee.get('email'), attendee) for attendee in event_row['attendees'])
+            event_row['attendees'] = list(attendees.values())
+            event_row['content_hash'] = GoogleCalendarEvent.get_content_hash(event_row)
+
+            if event_row['content_hash'] == event.content_hash:
+                unchanged_event_pks[event.canonical_key] = event.id
+
+        return unchanged_event_pks
+
+    @staticmethod
+    def _save_memberships(calendar: GoogleCalendar, canonical_keys, event_pks):
+        stored_memberships = dict(GoogleCalendarEventMembership.objects
+                                  .filter(calendar=calendar, event_id__in=canonical_keys.keys())
+                                  .values_list('event_id', 'google_calendar_event'))
+
+        membership_rows = [{
+            'calendar': calendar,
+            'event_id': event_id,
+            'google_calendar_event_id': event_pks[canonical_key],
+        } for event_id, canonical_key in canonical_keys.items()
+            if stored_memberships.get(event_id) != event_pks[canonical_key]]
+
+        if len(membership_rows) == 0:
+            return
+
+        GoogleCalendarEventMembership.objects\
+            .on_conflict(['calendar', 'event_id'], ConflictAction.UPDATE)\
+            .bulk_insert(membership_rows)
+
+    @staticmethod
+    def _apply_recurring_series(app_client: Client, event_rows, master_keys):
+        """
+        Links the events of recurring series to their `GoogleCalendarRecurringSeries`. The series content
+        is taken from the master, or from the first instance until the master is fetched (the instances
+        inheriting from it are detached then). The fields of an event equal to the series' are emptied
+        and marked as inherited.
+        """
+        inheritable_fields = GoogleCalendarRecurringSeries.INHERITABLE_FIELDS
+
+        series_rows = {}
+        for canonical_key, event_row in event_rows.items():
+            if not event_row['i_cal_uid'] or (canonical_key not in master_keys and not event_row['recurring_event_id']):
+                continue
+
+            series_key = GoogleCalendarRecurringSeries.get_series_key(app_client.id, event_row['i_cal_uid'])
+            series_row = dict({'client': app_client, 'series_key': series_key},
+                              **{field: event_row[field] for field in inheritable_fields})
+
+            if canonical_key in master_keys or series_key not in series_rows:
+                series_rows[series_key] = (series_row, canonical_key in master_keys)
+
+        if len(series_rows) == 0:
+            return
+
+        for series_row, is_master in series_rows.values():
+            series_row['is_from_master'] = is_master
+
+        master_series_rows = [series_row for series_row, is_master in series_rows.values() if is_master]
+        if len(master_series_rows) > 0:
+            CalendarStorage._detach_from_instance_series([row['series_key'] for row in master_series_rows])
+            GoogleCalendarRecurringSeries.objects\
+                .on_conflict(['series_key'], ConflictAction.UPDATE)\
+                .bulk_insert(master_series_rows)
+
+        instance_series_rows = [series_row for series_row, is_master in series_rows.values() if not is_master]
+        if len(instance_series_rows) > 0:     # an instance doesn't override the content of the series
+            GoogleCalendarRecurringSeries.objects\
+                .on_conflict(['series_key'], ConflictAction.NOTHING)\
+                .bulk_insert(instance_series_rows)
+
+        series_by_key = {series.series_key: series for series in GoogleCalendarRecurringSeries.objects
+                         .filter(series_key__in=series_rows.keys())}
+
+        for event_row in event_rows.values():
+            if not event_row['i_cal_uid']:
+                continue
+
+            series = series_by_key.get(GoogleCalendarRecurringSeries.get_series_key(app_client.id,
+                                                                                    event_row['i_cal_uid']))
+            if series is None:
+                continue
+
+            event_row['recurring_series'] = series
+            for field, inherited_value in inheritable_fields.items():
+                if event_row[field] == getattr(series, field):
+                    event_row[field] = inherited_value
+                    event_row['inherited_fields'].append(field)
+
+    @staticmethod
+    def _detach_from_instance_series(series_keys):
+        """
+        A series whose content is taken from an instance is overwritten when its master is fetched.
+        The events inheriting from it get their inherited values back first, otherwise their own
+        values (e.g. an instance's overridden summary) would be lost.
+        """
+        events = GoogleCalendarEvent.objects\
+            .select_related('recurring_series')\
+            .filter(recurring_series__series_key__in=series_keys, recurring_series__is_from_master=False)\
+            .exclude(inherited_fields=[])
+
+        for event in events:
+            inherited_fields = event.inherited_fields
+            event.read_through_series()
+            event.inherited_fields = []
+            event.save(update_fields=inherited_fields + ['inherited_fields', 'db_updated_at'])
+
+    @staticmethod
+    def _remove_calendar_events(calendar: GoogleCalendar, event_ids):
+        memberships = GoogleCalendarEventMembership.objects.filter(calendar=calendar, event_id__in=event_ids)
+        event_pks = set(memberships.values_list('google_calendar_event', flat=True))
+        memberships.delete()
+
+        events_left_out = GoogleCalendarEvent.objects.filter(id__in=event_pks, membership__isnull=True)
+        series_pks = set(events_left_out.exclude(recurring_series__isnull=True)
+                         .values_list('recurring_series', flat=True))
+        events_left_out.delete()
+
+        # events stored before the deduplication have no membership
+        GoogleCalendarEvent.objects.filter(canonical_key__isnull=True, event_id__in=event_ids).delete()
+
+        GoogleCalendarRecurringSeries.objects.filter(id__in=series_pks, event__isnull=True).delete()
+
+    @staticmethod
+    def _adopt_legacy_events(canonical_keys):
+        """
+        Events stored before the deduplication (keyed on `event_id`, without `canonical_key`) get their key,
+        so they are updated instead of duplicated. If the meeting has a canonical event already, the legacy
+        copy is a duplicate and is deleted.
+        """
+        legacy_events = list(GoogleCalendarEvent.objects
+                             .filter(canonical_key__isnull=True, event_id__in=canonical_keys.keys())
+                             .values_list('id', 'event_id'))
+
+        if len(legacy_events) == 0:
+            return
+
+        taken_keys = set(GoogleCalendarEvent.objects
+                         .filter(canonical_key__in=canonical_keys.values())
+                         .values_list('canonical_key', flat=True))
+
+        for event_pk, event_id in legacy_events:
+            canonical_key = canonical_keys[event_id]
+
+            if canonical_key in taken_keys:
+                GoogleCalendarEvent.objects.filter(id=event_pk).delete()
+                continue
+
+            GoogleCalendarEvent.objects.filter(id=event_pk).update(canonical_key=canonical_key)
+            taken_keys.add(canonical_key)
+
+    @staticmethod
+    def _adopt_rekeyed_events(calendar: GoogleCalendar, canonical_keys):
+        """
+        Events whose canonical key is computed differently now (e.g. a start time not normalized to UTC)
+        are found through the calendar's memberships and get the new key. If the meeting is stored under
+        the new key already, the old copy is a duplicate; it is deleted once it is left in no calendar.
+        Only the keys of recurring instances starting at a `dateTime` changed, the others are not looked up.
+        :param canonical_keys: dict of event id in the calendar -> canonical key, of the instances
+        :return: primary keys of the duplicates
+        """
+        if len(canonical_keys) == 0:
+            return []
+
+        stale_events = list(GoogleCalendarEventMembership.objects
+                            .filter(calendar=calendar, event_id__in=canonical_keys.keys())
+                            .exclude(google_calendar_event__canonical_key__isnull=True)
+                            .values_list('event_id', 'google_calendar_event_id',
+                                         'google_calendar_event__canonical_key'))
+        stale_events = [(event_id, event_pk) for event_id, event_pk, canonical_key in stale_events
+                        if canonical_key != canonical_keys[event_id]]
+
+        if len(stale_events) == 0:
+            return []
+
+        taken_keys = set(GoogleCalendarEvent.objects
+                         .filter(canonical_key__in=[canonical_keys[event_id] for event_id, _ in stale_events])
+                         .values_list('canonical_key', flat=True))
+        duplicate_event_pks = []
+
+        for event_id, event_pk in stale_events:
+            canonical_key = canonical_keys[event_id]
+
+            if canonical_key in taken_keys:
+                duplicate_event_pks.append(event_pk)
+                continue
+
+            GoogleCalendarEvent.objects.filter(id=event_pk).update(canonical_key=canonical_key)
+            taken_keys.add(canonical_key)
+
+        return duplicate_event_pks
+
+    @staticmethod
+    def save_calendar_events_page(api_response, calendar: GoogleCalendar, sync_detail, history_sync_detail=None):
+        """
+        Events of a page and the calendar's new page/sync token are committed together,
+        so a restarted sync resumes exactly after the last committed page
+        :return: set of primary keys of the changed events
+        """
+        update_fields = ['sync_detail', 'last_sync_datetime', 'db_updated_at']
+
+        with transaction.atomic():
+            changed_event_pks = CalendarStorage.save_calendar_events(api_response, calendar)
+
+            calendar.sync_detail = sync_detail
+            calendar.last_sync_datetime = timezone.now()
+
+            if history_sync_detail is not None:
+                calendar.history_sync_detail = history_sync_detail
+                update_fields.append('history_sync_detail')
+
+            calendar.save(update_fields=update_fields)
+
+        return changed_event_pks
+
+    @staticmethod
+    def save_calendar_history_page(api_response, calendar: GoogleCalendar, history_sync_detail):
+        """
+        Events older than the sync horizon are committed with their own checkpoint,
+        the incremental sync state in `sync_detail` is left untouched
+        :return: set of primary keys of the changed events
+        """
+        with transaction.atomic():
+            changed_event_pks = CalendarStorage.save_calendar_events(api_response, calendar)
+
+            calendar.history_sync_detail = history_sync_detail
+            calendar.save(update_fields=['history_sync_detail', 'db_updated_at'])
+
+        return changed_event_pks
+
+    def events_saved(self, changed_event_pks):
+        """
+        Reports the changed events of a committed page to the `on_events_saved` callback, if any
+        """
+        if self._on_events_saved is not None and len(changed_event_pks) > 0:
+            self._on_events_saved(changed_event_pks)
 
     def log(self, **kwargs):
         self._logger_fn(**kwargs)
@@ -156,19 +715,27 @@ class CalendarSyncer:
                       'primary,summary,summaryOverride,timeZone),nextPageToken,nextSyncToken'
 
     CAL_EVENT_FIELDS = 'items(' \
-                       'attendees(additionalGuests,displayName,email,id,optional,resource,responseStatus),' \
+                       'attendees(additionalGuests,displayName,email,id,optional,resource,responseStatus,self),' \
                        'created,creator(displayName,email),description,' \
-                       'end,htmlLink,id,organizer(displayName,email),recurringEventId,' \
+                       'end,htmlLink,iCalUID,id,organizer(displayName,email,self),originalStartTime,' \
+                       'recurrence,recurringEventId,' \
                        'start,status,summary,updated' \
                        '),' \
                        'nextPageToken,nextSyncToken,timeZone'
 
     CAL_EVENT_TIME_MIN = '2015-01-01T00:00:00+00:00'
 
-    def __init__(self, user: User, storage: CalendarStorage):
+    SETTING_HORIZON_MONTHS = 'calendar_sync_horizon_months'     # initial sync covers only the recent months
+
+    CAL_LIST_MAX_RESULTS = 250          # upper limits of the API
+    CAL_EVENT_MAX_RESULTS = 2500
+    CAL_EVENT_BATCH_SIZE = 50           # calls per batch request allowed by the Calendar API
+
+    def __init__(self, user: User, storage: CalendarStorage, reader_pool: CalendarReaderPool=None):
         self._user = user
-        self._connector = CalendarConnector(user=user)
+        self._connector = CalendarConnector.get_for_user(user)
         self._storage = storage
+        self._reader_pool = reader_pool or CalendarReaderPool()
 
     def sync_calendar_list(self):
         print("Syncing Calendar List for {}".format(self._user.email))
@@ -193,10 +760,14 @@ class CalendarSyncer:
         sync_token = sync_state.get('sync_token')
 
         while True:
+            request_page_token, request_sync_token = page_token, sync_token
+
             try:
                 print(" fetching page of calendar list")
-                response = service.calendarList().list(fields=fields, pageToken=page_token, syncToken=sync_token)\
-                    .execute()
+                response = service.calendarList().list(fields=fields,
+                                                       maxResults=self.CAL_LIST_MAX_RESULTS,
+                                                       pageToken=page_token,
+                                                       syncToken=sync_token).execute()
             except HttpError as exception:
                 status_code = exception.resp.status
                 error_msg = json.loads(exception.content)['error']['errors'][0]['message']
@@ -209,16 +780,6 @@ class CalendarSyncer:
                                   response={'statusCode': status_code, 'errorMsg': error_msg})
                 raise RetrySync(status_code)
 
-            self._storage.save_calendars(response, self._user)
-
-            self._storage.log(email_address=self._user.email,
-                              resource='calendarList',
-                              args={
-                                  'fields': fields,
-                                  'pageToken': page_token,
-                                  'syncToken': sync_token,
-                              },
-                              response=response)
             sync_detail = {}
 
             sync_token = None
@@ -231,76 +792,566 @@ class CalendarSyncer:
                 sync_detail[GoogleCalendarListSyncState.KEY_PAGE_TOKEN] = response['nextPageToken']
                 page_token = response['nextPageToken']
 
-            sync_object = GoogleCalendarListSyncState(user=self._user)
-            sync_object.sync_detail = sync_detail
-            sync_object.save()
+            self._storage.save_calendars_page(response, self._user, sync_detail)
+
+            self._storage.log(email_address=self._user.email,
+                              resource='calendarList',
+                              args={
+                                  'fields': fields,
+                                  'pageToken': request_page_token,
+                                  'syncToken': request_sync_token,
+                              },
+                              response=response)
 
             if not page_token:
                 break
         print(' calendar list fetching function is done')
 
     def sync_calendar_events(self, calendar: GoogleCalendar):
-        sync_state = self._storage.get_last_calendar_sync_state(calendar)
-        self._sync_calendar_events_from_state(calendar, sync_state)
+        """
+        A calendar is sync'ed by one worker at a time (e.g. a push notification job and the pipeline)
+        :return: number of changed events fetched, `None` if the sync has failed or runs elsewhere
+        """
+        with advisory_lock(LOCK_NAMESPACE_CALENDAR_SYNC, calendar.id) as is_acquired:
+            if not is_acquired:
+                print(" Calendar {} is being sync'ed elsewhere, skipped".format(calendar.email_address))
+                return None
+
+            backfill = CalendarBackfill.get_for_calendar(calendar, self._storage)
+            if backfill is not None:
+                return backfill.run()
+
+            sync_state = self._storage.get_last_calendar_sync_state(calendar)
+            return self._sync_calendar_events_from_state(calendar, sync_state)
 
     def _sync_calendar_events_from_state(self, calendar: GoogleCalendar, sync_state):
-        fields = self.CAL_EVENT_FIELDS
-        service = self._connector.get_service()
-
         page_token = sync_state.get('page_token')
         sync_token = sync_state.get('sync_token')
+        change_count = 0
 
         while True:
-            query_params = {
-                'calendarId': calendar.email_address,
-                'fields': fields,
-                'pageToken': page_token,
-                'syncToken': sync_token,
-            }
-
-            if sync_state.get(GoogleCalendar.KV_SYNC_STATE_KEY) == GoogleCalendar.KV_SYNC_STATE_VAL_UNINITIALIZED:
-                query_params['timeMin'] = self.CAL_EVENT_TIME_MIN
+            query_params = self._get_calendar_events_query_params(calendar, sync_state, page_token, sync_token)
 
             print(" Fetching a page of events for calendar: {}".format(calendar.email_address))
 
             try:
-                response = service.events().list(**query_params).execute()
+                response = self._execute_events_list(calendar, query_params)
             except HttpError as exception:
                 print("Exception has occurred!")
                 status_code = exception.resp.status
                 error_msg = json.loads(exception.content)['error']['errors'][0]['message']
                 print("Error: Code ['{}'], Message ['{}']".format(status_code, error_msg))
-                return
+                self._storage.log(email_address=calendar.email_address,
+                                  resource='events',
+                                  args=query_params,
+                                  response={'statusCode': status_code, 'errorMsg': error_msg})
+                return None
 
-            self._storage.save_calendar_events(response, calendar.sync_user.client)
-            self._storage.log(email_address=calendar.email_address,
+            page_token, sync_token = self._save_calendar_events_page(calendar, query_params, response)
+            change_count += len(response.get('items', []))
+
+            if not page_token:
+                break
+
+        print(" Calendar Event Fetching is Done for {}".format(calendar.email_address))
+        return change_count
+
+    def _execute_events_list(self, calendar: GoogleCalendar, query_params):
+        """
+        Lists the events with the credentials of one of the calendar's readers, failing over to the next one
+        """
+        last_exception = None
+
+        for reader in self._reader_pool.get_readers(calendar):
+            try:
+                service = CalendarConnector.get_for_user(reader).get_service()
+                return service.events().list(**query_params).execute()
+            except (HttpError, client.HttpAccessTokenRefreshError, OAuth2UserNotAvailable) as exception:
+                if not CalendarReaderPool.is_failover_error(exception):
+                    raise
+                self._reader_pool.mark_unavailable(reader, exception)
+                last_exception = exception
+
+        raise last_exception
+
+    def _get_calendar_events_query_params(self, calendar: GoogleCalendar, sync_state, page_token, sync_token):
+        query_params = {
+            'calendarId': calendar.email_address,
+            'fields': self.CAL_EVENT_FIELDS,
+            'maxResults': self.CAL_EVENT_MAX_RESULTS,
+            'pageToken': page_token,
+            'syncToken': sync_token,
+        }
+
+        time_min = sync_state.get(GoogleCalendar.KEY_TIME_MIN)     # set while resuming the initial page stream
+        if sync_state.get(GoogleCalendar.KV_SYNC_STATE_KEY) == GoogleCalendar.KV_SYNC_STATE_VAL_UNINITIALIZED:
+            time_min = self.get_initial_time_min(calendar)
+
+        if time_min:
+            query_params['timeMin'] = time_min
+
+        return query_params
+
+    def _save_calendar_events_page(self, calendar: GoogleCalendar, query_params, response):
+        """
+        Saves a fetched page of events and the calendar's sync state
+        :return: tuple of the page token and sync token to continue with
+        """
+        sync_detail = {
+            GoogleCalendar.KV_SYNC_STATE_KEY: GoogleCalendar.KV_SYNC_STATE_VAL_INITIALIZED
+        }
+
+        sync_token = None
+        next_sync_token = response.get('nextSyncToken', None)
+        if next_sync_token:
+            sync_detail[GoogleCalendar.KEY_SYNC_TOKEN] = next_sync_token
+            sync_token = next_sync_token
+
+        page_token = None
+        next_page_token = response.get('nextPageToken', None)
+        if next_page_token:
+            sync_detail[GoogleCalendar.KEY_PAGE_TOKEN] = next_page_token
+            page_token = next_page_token
+
+            if 'timeMin' in query_params:   # next pages must be asked with the same time range
+                sync_detail[GoogleCalendar.KEY_TIME_MIN] = query_params['timeMin']
+
+        history_sync_detail = None
+        if not page_token and 'timeMin' in query_params:    # initial sync is done, older events are left
+            history_sync_detail = CalendarHistorySync.get_initial_state(calendar, query_params['timeMin'])
+
+        changed_event_pks = self._storage.save_calendar_events_page(response, calendar, sync_detail,
+                                                                    history_sync_detail)
+        self._storage.events_saved(changed_event_pks)
+        self._storage.log(email_address=calendar.email_address,
+                          resource='events',
+                          args=query_params,
+                          response=response)
+
+        return page_token, sync_token
+
+    @classmethod
+    def get_initial_time_min(cls, calendar: GoogleCalendar):
+        """
+        The initial sync starts at the beginning of the month `SETTING_HORIZON_MONTHS` months ago,
+        the older events are filled later by `CalendarHistorySync`
+        :return: RFC 3339 `timeMin` of the initial sync
+        """
+        horizon_months = int(calendar.sync_user.client.get_setting(cls.SETTING_HORIZON_MONTHS, 0))
+
+        if horizon_months < 1:
+            return cls.CAL_EVENT_TIME_MIN
+
+        now = timezone.now()
+        month_index = now.year * 12 + now.month - 1 - horizon_months
+        horizon = datetime.datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+        return max(horizon.isoformat(), cls.CAL_EVENT_TIME_MIN)
+
+    def watch_calendar_events(self, calendar: GoogleCalendar, channel_id, token, address):
+        """
+        Opens a push notification channel for the calendar's events
+        :return: API response with `resourceId` and `expiration` (epoch in milliseconds)
+        """
+        body = {
+            'id': channel_id,
+            'token': token,
+            'type': 'web_hook',
+            'address': address,
+        }
+        return self._connector.get_service().events().watch(calendarId=calendar.email_address, body=body).execute()
+
+    def stop_channel(self, channel_id, resource_id):
+        body = {
+            'id': channel_id,
+            'resourceId': resource_id,
+        }
+        self._connector.get_service().channels().stop(body=body).execute()
+
+    @staticmethod
+    def is_calendar_ready_for_batch_poll(calendar: GoogleCalendar):
+        """
+        Only incremental polls (a sync token and no pending page) can be consolidated into a batch request
+        """
+        sync_state = calendar.get_last_sync_state()
+        return sync_state.get(GoogleCalendar.KV_SYNC_STATE_KEY) == GoogleCalendar.KV_SYNC_STATE_VAL_INITIALIZED \
+            and calendar.get_sync_token() is not None \
+            and calendar.get_page_token() is None
+
+    def poll_calendar_events_in_batch(self, calendars):
+        """
+        Sends the incremental polls of the given calendars with Google's batch endpoint,
+        `CAL_EVENT_BATCH_SIZE` calendars per HTTP request.
+
+        :param calendars: calendars sync'ed with this syncer's user, see `is_calendar_ready_for_batch_poll`
+        :return: tuple of
+            * list of calendars that still need a regular sync (failed polls or polls with more pages)
+            * dict of calendar id to the number of changed events fetched
+        """
+        service = self._connector.get_service()
+        calendars_to_sync = []
+        change_counts = {}
+
+        for chunk_start in range(0, len(calendars), self.CAL_EVENT_BATCH_SIZE):
+            chunk = calendars[chunk_start:chunk_start + self.CAL_EVENT_BATCH_SIZE]
+            query_params_list = [self._get_calendar_events_query_params(calendar,
+                                                                        calendar.get_last_sync_state(),
+                                                                        None,
+                                                                        calendar.get_sync_token())
+                                 for calendar in chunk]
+            processed = set()
+
+            def callback(request_id, response, exception):
+                index = int(request_id)
+                calendar = chunk[index]
+
+                if exception is not None:
+                    print("Batch poll failed for calendar {}: {}".format(calendar.email_address, exception))
+                    return      # left for the regular sync
+
+                try:
+                    with advisory_lock(LOCK_NAMESPACE_CALENDAR_SYNC, calendar.id) as is_acquired:
+                        if not is_acquired:     # the worker syncing it fetches the same changes
+                            print(" Calendar {} is being sync'ed elsewhere, skipped".format(calendar.email_address))
+                            processed.add(index)
+                            return
+
+                        page_token, _ = self._save_calendar_events_page(calendar, query_params_list[index],
+                                                                        response)
+                except Exception as e:     # a failing calendar doesn't abort the batch
+                    print("Saving the batch poll failed for calendar {}: {}".format(calendar.email_address, e))
+                    return      # left for the regular sync
+
+                processed.add(index)
+                change_counts[calendar.id] = len(response.get('items', []))
+
+                if page_token:
+                    calendars_to_sync.append(calendar)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for index, query_params in enumerate(query_params_list):
+                batch.add(service.events().list(**query_params), request_id=str(index))
+
+            print(" Polling events of {} calendars in a batch".format(len(chunk)))
+            self._connector.acquire_quota(len(chunk) - 1)   # the batch itself takes one
+
+            try:
+                batch.execute()
+            except HttpError as exception:
+                print("Batch request failed with code ['{}']".format(exception.resp.status))
+
+            calendars_to_sync.extend([calendar for index, calendar in enumerate(chunk) if index not in processed])
+
+        return calendars_to_sync, change_counts
+
+
+class CalendarBackfill:
+    """ Initial sync of a calendar in parallel time windows
+
+    Instead of one serial page stream from `CAL_EVENT_TIME_MIN`, the history is split
+    into `timeMin`/`timeMax` windows of `SETTING_WINDOW_MONTHS` months (the last one is open ended)
+    that are fetched by `SETTING_CONCURRENCY` threads. Finished windows are checkpointed
+    in the calendar's `sync_detail`, so an interrupted backfill continues with the remaining windows.
+
+    Once all the windows are stored, a sync token is asked for the whole range, and the events
+    changed since the backfill has started are fetched again (`updatedMin`), so no change
+    between a window's fetch and the sync token is lost. Then the calendar is in incremental mode.
+    """
+
+    SETTING_WINDOW_MONTHS = 'calendar_backfill_window_months'     # backfill is used if it is set
+    SETTING_CONCURRENCY = 'calendar_backfill_concurrency'
+
+    KEY_STARTED_AT = 'started_at'
+    KEY_TIME_MIN = 'time_min'
+    KEY_WINDOWS_DONE = 'windows_done'
+
+    SYNC_TOKEN_FIELDS = 'nextPageToken,nextSyncToken'
+
+    def __init__(self, calendar: GoogleCalendar, storage: CalendarStorage, window_months, concurrency):
+        self._calendar = calendar
+        self._storage = storage
+        self._window_months = window_months
+        self._concurrency = concurrency
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_for_calendar(cls, calendar: GoogleCalendar, storage: CalendarStorage):
+        """
+        :return: backfill of the calendar if the client uses backfills and the calendar needs one, otherwise `None`
+        """
+        app_client = calendar.sync_user.client
+        window_months = int(app_client.get_setting(cls.SETTING_WINDOW_MONTHS, 0))
+
+        if window_months < 1 or not cls.is_backfill_needed(calendar):
+            return None
+
+        concurrency = max(1, int(app_client.get_setting(cls.SETTING_CONCURRENCY, 4)))
+        return cls(calendar, storage, window_months, concurrency)
+
+    @staticmethod
+    def is_backfill_needed(calendar: GoogleCalendar):
+        sync_state = calendar.get_last_sync_state()
+
+        if GoogleCalendar.KEY_BACKFILL in sync_state:
+            return True
+
+        return sync_state.get(GoogleCalendar.KV_SYNC_STATE_KEY) == GoogleCalendar.KV_SYNC_STATE_VAL_UNINITIALIZED \
+            and calendar.get_page_token() is None
+
+    @staticmethod
+    def split_time_range(time_min: datetime.datetime, time_max: datetime.datetime, window_months):
+        """
+        :return: list of (window start, window end) in RFC 3339, the last window has no end
+        """
+        windows = []
+        window_start = time_min
+
+        while True:
+            month_index = window_start.year * 12 + window_start.month - 1 + window_months
+            window_end = window_start.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+            if window_end > time_max:
+                windows.append((window_start.isoformat(), None))
+                return windows
+
+            windows.append((window_start.isoformat(), window_end.isoformat()))
+            window_start = window_end
+
+    def run(self):
+        calendar = self._calendar
+        backfill_state = calendar.sync_detail.get(GoogleCalendar.KEY_BACKFILL)
+
+        if backfill_state is None:
+            backfill_state = {
+                self.KEY_STARTED_AT: timezone.now().isoformat(),
+                self.KEY_TIME_MIN: CalendarSyncer.get_initial_time_min(calendar),
+                self.KEY_WINDOWS_DONE: [],
+            }
+            self._save_backfill_state(backfill_state)
+
+        time_min = datetime.datetime.strptime(self._get_time_min(backfill_state), '%Y-%m-%dT%H:%M:%S+00:00')\
+            .replace(tzinfo=datetime.timezone.utc)
+        windows = self.split_time_range(time_min, timezone.now(), self._window_months)
+        pending_windows = [window for window in windows
+                           if window[0] not in backfill_state[self.KEY_WINDOWS_DONE]]
+
+        print(" Backfilling {} in {} windows ({} left)".format(calendar.email_address,
+                                                              len(windows),
+                                                              len(pending_windows)))
+
+        window_queue = queue.Queue()
+        for window in pending_windows:
+            window_queue.put(window)
+
+        self._change_count = 0
+        self._failed_windows = []
+
+        workers = [threading.Thread(target=self._window_worker, args=(window_queue, backfill_state))
+                   for _ in range(min(self._concurrency, len(pending_windows)))]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+        if len(self._failed_windows) > 0:
+            print(" Backfill of {} is incomplete, {} windows failed".format(calendar.email_address,
+                                                                           len(self._failed_windows)))
+            return None
+
+        return self._change_count + self._switch_to_incremental_sync(backfill_state)
+
+    def _window_worker(self, window_queue: queue.Queue, backfill_state):
+        try:
+            while True:
+                try:
+                    window = window_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                try:
+                    change_count = self._fetch_window(*window)
+                except Exception as e:
+                    print("Backfill window {} of {} failed: {}".format(window[0], self._calendar.email_address, e))
+                    with self._lock:
+                        self._failed_windows.append(window)
+                    continue
+
+                with self._lock:
+                    self._change_count += change_count
+                    backfill_state[self.KEY_WINDOWS_DONE].append(window[0])
+                    self._save_backfill_state(backfill_state)
+        finally:
+            connection.close()      # each worker thread has its own database connection
+
+    def _get_time_min(self, backfill_state):
+        # backfills started before the sync horizon existed cover the whole history
+        return backfill_state.get(self.KEY_TIME_MIN, CalendarSyncer.CAL_EVENT_TIME_MIN)
+
+    def _get_service(self):
+        return CalendarConnector.get_for_user(self._calendar.sync_user).get_service()
+
+    def _fetch_window(self, window_start, window_end):
+        return self._fetch_pages({
+            'calendarId': self._calendar.email_address,
+            'fields': CalendarSyncer.CAL_EVENT_FIELDS,
+            'maxResults': CalendarSyncer.CAL_EVENT_MAX_RESULTS,
+            'timeMin': window_start,
+            'timeMax': window_end,
+        })
+
+    def _fetch_pages(self, query_params):
+        """
+        Stores all the pages of a query, each page in its own transaction
+        :return: number of events fetched
+        """
+        service = self._get_service()
+        change_count = 0
+
+        while True:
+            response = service.events().list(**query_params).execute()
+
+            with transaction.atomic():
+                changed_event_pks = self._storage.save_calendar_events(response, self._calendar)
+            self._storage.events_saved(changed_event_pks)
+            self._storage.log(email_address=self._calendar.email_address,
                               resource='events',
                               args=query_params,
                               response=response)
-            sync_detail = {
-                GoogleCalendar.KV_SYNC_STATE_KEY: GoogleCalendar.KV_SYNC_STATE_VAL_INITIALIZED
+
+            change_count += len(response.get('items', []))
+            query_params = dict(query_params, pageToken=response.get('nextPageToken'))
+
+            if not query_params['pageToken']:
+                return change_count
+
+    def _switch_to_incremental_sync(self, backfill_state):
+        calendar = self._calendar
+        service = self._get_service()
+        time_min = self._get_time_min(backfill_state)
+        query_params = {
+            'calendarId': calendar.email_address,
+            'fields': self.SYNC_TOKEN_FIELDS,
+            'maxResults': CalendarSyncer.CAL_EVENT_MAX_RESULTS,
+            'timeMin': time_min,
+        }
+
+        while True:
+            response = service.events().list(**query_params).execute()
+            if response.get('nextPageToken') is None:
+                break
+            query_params['pageToken'] = response['nextPageToken']
+
+        sync_token = response.get('nextSyncToken')
+
+        change_count = self._fetch_pages({
+            'calendarId': calendar.email_address,
+            'fields': CalendarSyncer.CAL_EVENT_FIELDS,
+            'maxResults': CalendarSyncer.CAL_EVENT_MAX_RESULTS,
+            'timeMin': time_min,
+            'updatedMin': backfill_state[self.KEY_STARTED_AT],
+        })
+
+        update_fields = ['sync_detail', 'last_sync_datetime', 'db_updated_at']
+
+        calendar.sync_detail = {
+            GoogleCalendar.KV_SYNC_STATE_KEY: GoogleCalendar.KV_SYNC_STATE_VAL_INITIALIZED,
+            GoogleCalendar.KEY_SYNC_TOKEN: sync_token,
+        }
+        calendar.last_sync_datetime = timezone.now()
+
+        history_sync_detail = CalendarHistorySync.get_initial_state(calendar, time_min)
+        if history_sync_detail is not None:
+            calendar.history_sync_detail = history_sync_detail
+            update_fields.append('history_sync_detail')
+
+        calendar.save(update_fields=update_fields)
+
+        print(" Backfill of {} is done, switched to incremental sync".format(calendar.email_address))
+        return change_count
+
+    def _save_backfill_state(self, backfill_state):
+        self._calendar.sync_detail = dict(self._calendar.sync_detail, **{GoogleCalendar.KEY_BACKFILL: backfill_state})
+        self._calendar.save(update_fields=['sync_detail', 'db_updated_at'])
+
+
+class CalendarHistorySync:
+    """ Fills the events older than the client's sync horizon
+
+    The initial sync of a client with `CalendarSyncer.SETTING_HORIZON_MONTHS` covers only the recent months,
+    so they are queryable right away. The rest of the history (from `CAL_EVENT_TIME_MIN` up to the horizon)
+    is fetched page by page by a low priority job, checkpointed in the calendar's `history_sync_detail`.
+    The incremental sync token is not affected: it keeps following the changes after the horizon.
+    """
+
+    KEY_TIME_MIN = 'time_min'
+    KEY_TIME_MAX = 'time_max'
+    KEY_PAGE_TOKEN = 'page_token'
+    KEY_IS_DONE = 'is_done'
+
+    def __init__(self, calendar: GoogleCalendar, storage: CalendarStorage):
+        self._calendar = calendar
+        self._storage = storage
+
+    @classmethod
+    def get_initial_state(cls, calendar: GoogleCalendar, horizon):
+        """
+        :param horizon: RFC 3339 `timeMin` the initial sync is done with
+        :return: history checkpoint to start with, `None` if there is no history left out
+        """
+        if calendar.history_sync_detail or horizon <= CalendarSyncer.CAL_EVENT_TIME_MIN:
+            return None
+
+        return {
+            cls.KEY_TIME_MIN: CalendarSyncer.CAL_EVENT_TIME_MIN,
+            cls.KEY_TIME_MAX: horizon,
+            cls.KEY_IS_DONE: False,
+        }
+
+    @classmethod
+    def is_pending(cls, calendar: GoogleCalendar):
+        history_state = calendar.history_sync_detail
+        return bool(history_state) and not history_state.get(cls.KEY_IS_DONE, False)
+
+    def run(self):
+        """
+        :return: number of events fetched
+        """
+        calendar = self._calendar
+        history_state = dict(calendar.history_sync_detail)
+        service = CalendarConnector.get_for_user(calendar.sync_user).get_service()
+        change_count = 0
+
+        print(" Filling history of {} before {}".format(calendar.email_address, history_state[self.KEY_TIME_MAX]))
+
+        while not history_state.get(self.KEY_IS_DONE, False):
+            query_params = {
+                'calendarId': calendar.email_address,
+                'fields': CalendarSyncer.CAL_EVENT_FIELDS,
+                'maxResults': CalendarSyncer.CAL_EVENT_MAX_RESULTS,
+                'timeMin': history_state[self.KEY_TIME_MIN],
+                'timeMax': history_state[self.KEY_TIME_MAX],
+                'pageToken': history_state.get(self.KEY_PAGE_TOKEN),
             }
 
-            sync_token = None
-            next_sync_token = response.get('nextSyncToken', None)
-            if next_sync_token:
-                sync_detail[GoogleCalendar.KEY_SYNC_TOKEN] = next_sync_token
-                sync_token = next_sync_token
+            response = service.events().list(**query_params).execute()
 
-            page_token = None
-            next_page_token = response.get('nextPageToken', None)
-            if next_page_token:
-                sync_detail[GoogleCalendar.KEY_PAGE_TOKEN] = next_page_token
-                page_token = next_page_token
+            history_state = dict(history_state)
+            history_state[self.KEY_PAGE_TOKEN] = response.get('nextPageToken')
+            history_state[self.KEY_IS_DONE] = history_state[self.KEY_PAGE_TOKEN] is None
 
-            calendar.sync_detail = sync_detail
-            calendar.last_sync_datetime = timezone.now()
-            calendar.save()
+            changed_event_pks = self._storage.save_calendar_history_page(response, calendar, history_state)
+            self._storage.events_saved(changed_event_pks)
+            self._storage.log(email_address=calendar.email_address,
+                              resource='events',
+                              args=query_params,
+                              response=response)
 
-            if not page_token:
-                break
+            change_count += len(response.get('items', []))
 
-        print(" Calendar Event Fetching is Done for {}".format(calendar.email_address))
+        print(" History of {} is filled".format(calendar.email_address))
+        return change_count
 
 
 class SyncEnvironment:
@@ -315,20 +1366,135 @@ class SyncEnvironment:
     Other errors need to be handled, too.
     """
 
-    def __init__(self, app_client: Client):
+    SETTING_CONCURRENCY = 'calendar_sync_concurrency'   # number of calendars sync'ed in parallel
+    SETTING_BATCH_POLL = 'calendar_sync_batch_poll'     # incremental polls are consolidated in batch requests
+    SETTING_ADAPTIVE = 'calendar_sync_adaptive'         # only calendars due by their change rate are sync'ed
+
+    def __init__(self, app_client: Client, on_events_saved=None):
+        """
+        :param on_events_saved: see `CalendarStorage`
+        """
         self._client = app_client       # type: Client
-        self._storage = CalendarStorage(GoogleCalendarApiLogs.log)  # type: CalendarStorage
+        self._log_writer = BufferedApiLogWriter()
+        self._storage = CalendarStorage(self._log_writer.log, on_events_saved)  # type: CalendarStorage
         self._syncers = {}
+        self._reader_pool = CalendarReaderPool()
+        self._concurrency = max(1, int(app_client.get_setting(self.SETTING_CONCURRENCY, 1)))
+        self._is_batch_poll = bool(app_client.get_setting(self.SETTING_BATCH_POLL, False))
+        self._scheduler = AdaptiveSyncScheduler() if app_client.get_setting(self.SETTING_ADAPTIVE, False) \
+            else None
+        self._previous_sync_datetimes = {}
+        self._polled_change_counts = {}
 
     def sync(self):
+        try:
+            self._sync()
+        finally:
+            self._log_writer.close()
+
+    def _sync(self):
         for user in self._client.user_set.all():
-            syncer = CalendarSyncer(user=user, storage=self._storage)
-            syncer.sync_calendar_list()
+            syncer = CalendarSyncer(user=user, storage=self._storage, reader_pool=self._reader_pool)
+            if self._scheduler is None or self._scheduler.is_calendar_list_due(user):
+                syncer.sync_calendar_list()
             self._syncers[user.email] = syncer
 
-        calendars_list = self._storage.get_calendars(self._client)
+        calendars_list = list(self._storage.get_calendars(self._client))
+
+        if self._scheduler is not None:
+            calendars_list = self._scheduler.get_due_calendars(calendars_list)
+            print("{} calendars are due for sync".format(len(calendars_list)))
+
+        self._previous_sync_datetimes = {calendar.id: calendar.last_sync_datetime for calendar in calendars_list}
+
+        if self._is_batch_poll:
+            calendars_list = self._poll_calendars_in_batches(calendars_list)
+
+        if self._concurrency > 1:
+            self._sync_calendars_concurrently(calendars_list)
+            return
 
         for calendar in calendars_list:
             user = calendar.sync_user
             print("Syncing Calendar Events for {}, sync user: {}".format(calendar.email_address, user.email))
-            self._syncers[user.email].sync_calendar_events(calendar)
+            self._sync_calendar_events(self._syncers[user.email], calendar)
+
+    def _sync_calendar_events(self, syncer: CalendarSyncer, calendar: GoogleCalendar):
+        change_count = syncer.sync_calendar_events(calendar)
+
+        if change_count is not None:
+            self._record_calendar_sync(calendar, change_count + self._polled_change_counts.get(calendar.id, 0))
+
+    def _record_calendar_sync(self, calendar: GoogleCalendar, change_count):
+        if self._scheduler is None:
+            return
+
+        self._scheduler.record_calendar_sync(calendar, change_count, self._previous_sync_datetimes.get(calendar.id))
+
+    def _poll_calendars_in_batches(self, calendars_list):
+        """
+        Incremental polls are grouped by sync user, since a batch request runs with a single user's credentials.
+        :return: calendars left for the regular (page by page) sync
+        """
+        calendars_to_sync = []
+        calendars_by_user = {}
+
+        for calendar in calendars_list:
+            user_email = calendar.sync_user.email
+            if user_email in self._syncers and CalendarSyncer.is_calendar_ready_for_batch_poll(calendar):
+                calendars_by_user.setdefault(user_email, []).append(calendar)
+            else:
+                calendars_to_sync.append(calendar)
+
+        for user_email, calendars in calendars_by_user.items():
+            pending_calendars, change_counts = self._syncers[user_email].poll_calendar_events_in_batch(calendars)
+            calendars_to_sync.extend(pending_calendars)
+            self._polled_change_counts.update(change_counts)
+
+            for calendar in calendars:
+                if calendar not in pending_calendars:
+                    self._record_calendar_sync(calendar, change_counts.get(calendar.id, 0))
+
+        return calendars_to_sync
+
+    def _sync_calendars_concurrently(self, calendars_list):
+        """
+        Each calendar is handed to exactly one worker, so its `sync_detail` is only written by that worker.
+        Workers keep their own syncers (hence their own `httplib2.Http`) since the transport is not thread-safe.
+        """
+        calendar_queue = queue.Queue()
+        for calendar in calendars_list:
+            calendar_queue.put(calendar)
+
+        workers = [threading.Thread(target=self._calendar_sync_worker, args=(calendar_queue,))
+                   for _ in range(min(self._concurrency, calendar_queue.qsize()))]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+    def _calendar_sync_worker(self, calendar_queue: queue.Queue):
+        worker_syncers = {}
+
+        try:
+            while True:
+                try:
+                    calendar = calendar_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                user = calendar.sync_user
+                print("Syncing Calendar Events for {}, sync user: {}".format(calendar.email_address, user.email))
+
+                try:
+                    if user.email not in worker_syncers:
+                        worker_syncers[user.email] = CalendarSyncer(user=user,
+                                                                    storage=self._storage,
+                                                                    reader_pool=self._reader_pool)
+                    self._sync_calendar_events(worker_syncers[user.email], calendar)
+                except Exception as e:
+                    print("Unexpected error for calendar {}: {}".format(calendar.email_address, e))
+        finally:
+            connection.close()      # each worker thread has its own database connection
@@ -0,0 +1,80 @@
+"""
+Google API discovery documents are cached on disk and parsed once per process.
+
+`discovery.build` downloads and parses the document for every service it builds.
+Here the document is read from `GOOGLE_DISCOVERY_CACHE_DIR` (the system temp directory
+if not set; point it to a directory with vendored documents to avoid network completely),
+downloaded only when it isn't there, and services are built from the parsed copy.
+"""
+import copy
+import json
+import os
+import tempfile
+import threading
+
+import httplib2
+from googleapiclient import discovery
+from googleapiclient.errors import HttpError
+
+from ears.env_variables import GOOGLE_DISCOVERY_CACHE_DIR
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def _get_cache_file_path(api_name, api_version):
+    cache_dir = GOOGLE_DISCOVERY_CACHE_DIR or tempfile.gettempdir()
+    return os.path.join(cache_dir, 'google-discovery-{}-{}.json'.format(api_name, api_version))
+
+
+def _download_document(api_name, api_version):
+    uri = discovery.DISCOVERY_URI.format(api=api_name, apiVersion=api_version)
+    resp, content = httplib2.Http().request(uri)
+
+    if resp.status >= 400:
+        raise HttpError(resp, content, uri=uri)
+
+    return content.decode('utf-8')
+
+
+def _read_or_download_document(api_name, api_version):
+    file_path = _get_cache_file_path(api_name, api_version)
+
+    try:
+        with open(file_path) as document_file:
+            return json.load(document_file)
+    except (IOError, ValueError):
+        pass
+
+    content = _download_document(api_name, api_version)
+    document = json.loads(content)
+
+    try:
+        temp_file_path = '{}.{}.tmp'.format(file_path, os.getpid())
+        with open(temp_file_path, 'w') as document_file:
+            document_file.write(content)
+        os.replace(temp_file_path, file_path)      # other processes never see a half written document
+    except IOError as exc:
+        print("Discovery document couldn't be cached at {}: {}".format(file_path, exc))
+
+    return document
+
+
+def get_discovery_document(api_name, api_version):
+    key = (api_name, api_version)
+
+    with _documents_lock:
+        if key not in _documents:
+            _documents[key] = _read_or_download_document(api_name, api_version)
+        return _documents[key]
+
+
+def build_service(api_name, api_version, http):
+    """
+    Cheap replacement of `discovery.build` for an authorized `http`.
+
+    The client library fills in method descriptions lazily while the service is used,
+    so every service gets its own copy of the parsed document.
+    """
+    document = copy.deepcopy(get_discovery_document(api_name, api_version))
+    return discovery.build_from_document(document, http=http)
@@ -0,0 +1,155 @@
+import json
+import time
+
+import django_rq
+from django.conf import settings
+
+# Refills and takes tokens from all the given buckets atomically. Tokens are taken only
+# if every bucket has enough of them; otherwise the seconds to wait are returned.
+#   KEYS: bucket keys, ARGV: now, requested tokens, then (rate, capacity) per bucket
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local requested = tonumber(ARGV[2])
+local wait = 0
+local levels = {}
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + i * 2])
+    local capacity = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'timestamp')
+    local tokens = tonumber(state[1]) or capacity
+    local timestamp = tonumber(state[2]) or now
+
+    tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+    levels[i] = tokens
+
+    if tokens < requested then
+        wait = math.max(wait, (requested - tokens) / rate)
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - requested
+    end
+    redis.call('HMSET', key, 'tokens', tokens, 'timestamp', now)
+    redis.call('EXPIRE', key, 3600)
+end
+
+return tostring(wait)
+"""
+
+RATE_LIMIT_REASONS = ['rateLimitExceeded', 'userRateLimitExceeded']
+
+
+class GoogleApiQuota:
+    """ Token buckets in Redis shared by all the processes calling Google APIs
+
+    Every request takes a token from the project's bucket and from the user's bucket,
+    waiting if either is empty, so the processes together stay under the quota
+    instead of each one retrying on 403/429 responses on its own.
+    A rate limit response empties the user's bucket to back off everyone using that user.
+    """
+
+    KEY_PREFIX = 'google-api-quota'
+
+    def __init__(self, redis_connection=None):
+        config = getattr(settings, 'GOOGLE_API_QUOTA', {})
+
+        self._project_rate = config.get('PROJECT_RATE', 10)         # requests per second
+        self._project_capacity = config.get('PROJECT_CAPACITY', 20)
+        self._user_rate = config.get('USER_RATE', 5)
+        self._user_capacity = config.get('USER_CAPACITY', 10)
+
+        self._redis = django_rq.get_connection('default') if redis_connection is None else redis_connection
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def _get_project_key(self):
+        return '{}:project'.format(self.KEY_PREFIX)
+
+    def _get_user_key(self, user_id):
+        return '{}:user:{}'.format(self.KEY_PREFIX, user_id)
+
+    def get_max_count(self):
+        """
+        :return: number of tokens that can be taken at once, i.e. the capacity of the smaller bucket
+        """
+        return min(self._project_capacity, self._user_capacity)
+
+    def try_acquire(self, user_id, count=1):
+        """
+        :return: seconds to wait before trying again, 0 if the tokens are taken
+        """
+        if count > self.get_max_count():    # the buckets never hold that many tokens, it would wait forever
+            raise ValueError("Can't take {} tokens at once, bucket capacity is {}".format(count,
+                                                                                       self.get_max_count()))
+
+        keys = [self._get_project_key(), self._get_user_key(user_id)]
+        args = [time.time(), count,
+                self._project_rate, self._project_capacity,
+                self._user_rate, self._user_capacity]
+        return float(self._script(keys=keys, args=args))
+
+    def acquire(self, user_id, count=1):
+        """
+        Waits until the tokens are taken. More tokens than a bucket holds (e.g. for the calls of
+        a batch request) are taken in chunks of at most `get_max_count()`.
+        """
+        while count > 0:
+            chunk = min(count, self.get_max_count())
+
+            wait = self.try_acquire(user_id, chunk)
+            if wait > 0:
+                time.sleep(wait)
+                continue
+
+            count -= chunk
+
+    def penalize(self, user_id):
+        self._redis.hmset(self._get_user_key(user_id), {'tokens': 0, 'timestamp': time.time()})
+
+    @staticmethod
+    def is_rate_limit_response(resp, content):
+        if resp.status == 429:
+            return True
+
+        if resp.status != 403:
+            return False
+
+        try:
+            errors = json.loads(content.decode('utf-8') if isinstance(content, bytes) else content)['error']['errors']
+        except (ValueError, KeyError, TypeError):
+            return False
+
+        return any(error.get('reason') in RATE_LIMIT_REASONS for error in errors)
+
+
+class RateLimitedHttp:
+    """ Wraps an authorized `httplib2.Http` so that every request goes through `GoogleApiQuota` """
+
+    def __init__(self, http, quota: GoogleApiQuota, user_id):
+        self._http = http
+        self._quota = quota
+        self._user_id = user_id
+
+        def request(*args, **kwargs):
+            quota.acquire(user_id)
+            resp, content = http.request(*args, **kwargs)
+
+            if GoogleApiQuota.is_rate_limit_response(resp, content):
+                quota.penalize(user_id)
+
+            return resp, content
+
+        # the client library looks for the credentials on `http.request` (e.g. for batch requests)
+        if hasattr(http.request, 'credentials'):
+            request.credentials = http.request.credentials
+
+        self.request = request
+
+    def acquire(self, count=1):
+        self._quota.acquire(self._user_id, count)
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
@@ -0,0 +1,76 @@
+import datetime
+
+from django.utils import timezone
+
+from apps.google_calendar.models import GoogleCalendar, GoogleCalendarListSyncState
+from apps.visualizer.models import User
+
+
+class AdaptiveSyncScheduler:
+    """ Decides which calendars to poll by their observed change rate
+
+    The change rate of a calendar (changed events per hour) is an exponentially weighted
+    moving average of its incremental syncs. The next sync of a calendar is planned
+    to fetch about `TARGET_CHANGES_PER_SYNC` changes, bounded by `MIN_INTERVAL` and `MAX_INTERVAL`:
+    busy calendars are polled often, dormant ones rarely.
+
+    Calendar lists change rarely; a user's list is sync'ed again only after `CALENDAR_LIST_TTL`.
+    """
+
+    MIN_INTERVAL = datetime.timedelta(minutes=30)
+    MAX_INTERVAL = datetime.timedelta(hours=24)
+    TARGET_CHANGES_PER_SYNC = 5
+    SMOOTHING_FACTOR = 0.3              # weight of the latest observation
+    CALENDAR_LIST_TTL = datetime.timedelta(hours=12)
+
+    def is_calendar_list_due(self, user: User, now=None):
+        now = timezone.now() if now is None else now
+        last_sync = GoogleCalendarListSyncState.get_last_sync(user)
+
+        if last_sync is None or last_sync.get_page_token() is not None:
+            return True
+
+        return last_sync.db_created_at + self.CALENDAR_LIST_TTL <= now
+
+    @staticmethod
+    def is_calendar_due(calendar: GoogleCalendar, now=None):
+        now = timezone.now() if now is None else now
+
+        if calendar.get_sync_token() is None or calendar.get_page_token() is not None:
+            return True         # initial sync or an unfinished page stream
+
+        return calendar.next_sync_datetime is None or calendar.next_sync_datetime <= now
+
+    def get_due_calendars(self, calendars, now=None):
+        now = timezone.now() if now is None else now
+        return [calendar for calendar in calendars if self.is_calendar_due(calendar, now)]
+
+    def get_next_interval(self, change_rate):
+        if change_rate <= 0:
+            return self.MAX_INTERVAL
+
+        interval = datetime.timedelta(hours=self.TARGET_CHANGES_PER_SYNC / change_rate)
+        return max(self.MIN_INTERVAL, min(self.MAX_INTERVAL, interval))
+
+    def get_updated_change_rate(self, change_rate, change_count, elapsed: datetime.timedelta):
+        elapsed_hours = max(elapsed, self.MIN_INTERVAL).total_seconds() / 3600
+        observed_rate = change_count / elapsed_hours
+        return self.SMOOTHING_FACTOR * observed_rate + (1 - self.SMOOTHING_FACTOR) * change_rate
+
+    def record_calendar_sync(self, calendar: GoogleCalendar, change_count, previous_sync_datetime, now=None):
+        """
+        :param change_count: changed events fetched by the sync
+        :param previous_sync_datetime: `last_sync_datetime` of the calendar before the sync,
+            `None` for the initial sync, which doesn't tell anything about the change rate
+        """
+        now = timezone.now() if now is None else now
+
+        if previous_sync_datetime is not None:
+            calendar.change_rate = self.get_updated_change_rate(calendar.change_rate,
+                                                                change_count,
+                                                                now - previous_sync_datetime)
+            calendar.next_sync_datetime = now + self.get_next_interval(calendar.change_rate)
+        else:
+            calendar.next_sync_datetime = now + self.MIN_INTERVAL
+
+        calendar.save(update_fields=['change_rate', 'next_sync_datetime', 'db_updated_at'])
@@ -33,6 +33,8 @@ RQ_DEFAULT_PORT = os.environ.get('RQ_DEFAULT_PORT')
 RQ_DEFAULT_DB = os.environ.get('RQ_DEFAULT_DB')
 RQ_DEFAULT_PASSWORD = os.environ.get('RQ_DEFAULT_PASSWORD')
 
+GOOGLE_API_QUOTA_ENABLED = os.environ.get('GOOGLE_API_QUOTA_ENABLED', 'false').lower() == 'true'
+
 # Integrations
 
 ## Outreach
@@ -44,6 +46,8 @@ OUTREACH_CLIENT_SECRET = os.environ.get('OUTREACH_CLIENT_SECRET')
 
 GOOGLE_OAUTH2_KEY = os.environ.get('GOOGLE_OAUTH2_KEY')
 GOOGLE_OAUTH2_SECRET = os.environ.get('GOOGLE_OAUTH2_SECRET')
+GOOGLE_DISCOVERY_CACHE_DIR = os.environ.get('GOOGLE_DISCOVERY_CACHE_DIR')
+GOOGLE_CALENDAR_NOTIFICATION_URL = os.environ.get('GOOGLE_CALENDAR_NOTIFICATION_URL')
 
 ## Salesforce
 
@@ -147,4 +147,37 @@ RQ_QUEUES = {
         'PASSWORD': RQ_DEFAULT_PASSWORD,
         'DEFAULT_TIMEOUT': 500,
     },
+    'low': {
+        'HOST': RQ_DEFAULT_HOST,
+        'PORT': RQ_DEFAULT_PORT,
+        'DB': RQ_DEFAULT_DB,
+        'PASSWORD': RQ_DEFAULT_PASSWORD,
+        'DEFAULT_TIMEOUT': 500,
+    },
+}
+
+# Google Calendar API Logs
+
+GOOGLE_CALENDAR_API_LOG = {
+    'SAMPLE_RATE': 0.1,         # ratio of successful responses logged, errors are always logged
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 5,        # seconds
+    'KEPT_ITEM_COUNT': 0,       # items kept from a logged successful response, the rest is hashed
+}
+
+# API Log Tables (see `partition_api_logs` command)
+
+API_LOG_PARTITIONING = {
+    'RETENTION_MONTHS': 6,      # older monthly partitions get dropped
+    'MONTHS_AHEAD': 2,          # partitions created in advance
+}
+
+# Google API Quota (token buckets shared through Redis)
+
+GOOGLE_API_QUOTA = {
+    'ENABLED': GOOGLE_API_QUOTA_ENABLED,    # off unless set, a development setup may have no Redis
+    'PROJECT_RATE': 10,         # requests per second for all the processes together
+    'PROJECT_CAPACITY': 20,     # burst size
+    'USER_RATE': 5,             # requests per second for a single user's token
+    'USER_CAPACITY': 10,
 }
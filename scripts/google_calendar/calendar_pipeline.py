@@ -1,9 +1,190 @@
-from .extract_google_calendar import run as extract_run
-from .transform_google_calendar import run as transform_calendar_run
-from .transform_google_calendar_event import run as transform_event_run
+import logging
+import queue
+import threading
+import uuid
 
+import daiquiri
+import django_rq
+from django.db import connection
+
+from apps.visualizer.models import Client, CLIENT_STATUS_ACTIVE
+from .extract_google_calendar import run as extract_run, extract_client
+from .transform_google_calendar import run as transform_calendar_run, transform_calendars
+from .transform_google_calendar_event import run as transform_event_run, transform_events, \
+    transform_saved_events, client_partitions_lock
+from .transform_google_calendar_busy_block import run as transform_busy_block_run, transform_busy_blocks
+
+daiquiri.setup(level=logging.INFO)
+logger = daiquiri.getLogger()
+
+QUEUE_NAME = 'default'
+CLIENT_JOB_TIMEOUT = 3 * 60 * 60        # seconds, the first sync of a client may take hours
+PIPELINE_KEY_TTL = 24 * 60 * 60         # seconds, the counters of an abandoned run expire
+STREAM_QUEUE_SIZE = 20                  # saved pages waiting for the transform, the extract waits when it is full
+
+
+def _get_pipeline_key(pipeline_id, name):
+    return 'google-calendar-pipeline:{}:{}'.format(pipeline_id, name)
+
+
+def transform_client(client: Client, warm_up_cache=False):
+    """
+    Runs every transform step of the client, a failing step doesn't stop the next ones
+    :return: True if all the steps succeeded
+    """
+    is_calendars_transformed = transform_calendars(client)
+    is_events_transformed = transform_events(client, warm_up_cache=warm_up_cache)
+    is_busy_blocks_transformed = transform_busy_blocks(client)
+
+    return is_calendars_transformed and is_events_transformed and is_busy_blocks_transformed
+
+
+def run_client_pipeline(client_id, pipeline_id=None):
+    """
+    Extract -> transform of a single client, run by the RQ worker
+    :return: True if the client is extracted and transformed without an exception
+    """
+    client = Client.objects.get(id=client_id)
+    is_extracted = False
+    is_transformed = False
+
+    try:
+        is_extracted = extract_client(client)
+        is_transformed = transform_client(client, warm_up_cache=True)
+    finally:
+        if pipeline_id is not None:
+            _report_client_done(pipeline_id, client_id, is_extracted, is_transformed)
+
+    return is_extracted and is_transformed
+
+
+def run_client_streaming_pipeline(client: Client):
+    """
+    Extract of a client with its saved pages of events handed to a transform thread as they are committed,
+    so fresh events don't wait for the whole extract. Events the stream misses are left in the outbox
+    and picked up by the event transform at the end.
+    :return: True if the client is extracted and transformed without an exception
+    """
+    page_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    consumer = threading.Thread(target=_transform_saved_pages, args=(client.id, page_queue))
+    consumer.start()
+
+    try:
+        is_extracted = extract_client(client, on_events_saved=page_queue.put)
+    finally:
+        page_queue.put(None)    # end of the stream
+        consumer.join()
+
+    is_transformed = transform_client(client)
+
+    return is_extracted and is_transformed
+
+
+def _transform_saved_pages(client_id, page_queue: queue.Queue):
+    """
+    Consumer of the streaming pipeline. It keeps draining the queue even when it can't transform,
+    otherwise the extract would block on the full queue.
+    """
+    is_stream_ended = False
+
+    try:
+        with client_partitions_lock(client_id) as is_acquired:
+            if not is_acquired:
+                logger.info("Event transform of client {} is running elsewhere, "
+                            "saved events are left in the outbox".format(client_id))
+
+            while True:
+                event_pks = page_queue.get()
+                if event_pks is None:
+                    is_stream_ended = True
+                    break
+
+                if not is_acquired:
+                    continue
+
+                try:
+                    transform_saved_events(event_pks)
+                except Exception as exc:
+                    logger.error("Streamed events of client {} are left in the outbox, "
+                                 "Exception Details: {}".format(client_id, exc))
+    except Exception as exc:
+        logger.error("Log This: Unexpected Exception Exception Details: {}".format(exc))
+        while not is_stream_ended:
+            is_stream_ended = page_queue.get() is None
+    finally:
+        connection.close()      # the consumer thread has its own database connection
+
+
+def _report_client_done(pipeline_id, client_id, is_extracted, is_transformed):
+    connection = django_rq.get_connection(QUEUE_NAME)
+    remaining_key = _get_pipeline_key(pipeline_id, 'remaining')
+    failed_extract_key = _get_pipeline_key(pipeline_id, 'failed-extract')
+    failed_transform_key = _get_pipeline_key(pipeline_id, 'failed-transform')
+
+    for failed_key, is_succeeded in ((failed_extract_key, is_extracted), (failed_transform_key, is_transformed)):
+        if not is_succeeded:
+            connection.incr(failed_key)
+            connection.expire(failed_key, PIPELINE_KEY_TTL)
+
+    remaining = connection.decr(remaining_key)
+    logger.info("Calendar pipeline {}: client {} is done (extracted: {}, transformed: {}), "
+                "{} clients remaining".format(pipeline_id, client_id, is_extracted, is_transformed, remaining))
+
+    if remaining > 0:
+        return
+
+    # the last client job reports the completion of the run
+    failed_extracts = int(connection.get(failed_extract_key) or 0)
+    failed_transforms = int(connection.get(failed_transform_key) or 0)
+    connection.delete(remaining_key, failed_extract_key, failed_transform_key)
+    logger.info("Calendar pipeline {} is complete, failed extracts: {}, failed transforms: {}".format(
+        pipeline_id, failed_extracts, failed_transforms))
+
+
+def fan_out_client_pipelines():
+    """
+    Coordinating job: enqueues one pipeline job per active client, the last finishing one reports completion
+    :return: pipeline id
+    """
+    client_ids = list(Client.objects.filter(status=CLIENT_STATUS_ACTIVE).values_list('id', flat=True))
+    pipeline_id = uuid.uuid4().hex
+
+    logger.info("Calendar pipeline {}: fanning out {} clients".format(pipeline_id, len(client_ids)))
+
+    if not client_ids:
+        return pipeline_id
+
+    connection = django_rq.get_connection(QUEUE_NAME)
+    connection.set(_get_pipeline_key(pipeline_id, 'remaining'), len(client_ids), ex=PIPELINE_KEY_TTL)
+
+    queue = django_rq.get_queue(QUEUE_NAME)
+
+    for client_id in client_ids:
+        queue.enqueue_call(func=run_client_pipeline,
+                           args=(client_id, pipeline_id),
+                           timeout=CLIENT_JOB_TIMEOUT,
+                           job_id='google-calendar-pipeline-{}-client-{}'.format(pipeline_id, client_id))
+
+    return pipeline_id
+
+
+def run(*args):
+    """
+    `./manage.py runscript calendar_pipeline` runs all clients in this process,
+    `--script-args=fan-out` spreads them over the RQ workers,
+    `--script-args=streaming` transforms the events of each client while its extract runs
+    """
+    if 'fan-out' in args:
+        django_rq.get_queue(QUEUE_NAME).enqueue_call(func=fan_out_client_pipelines)
+        return
+
+    if 'streaming' in args:
+        failed_client_ids = [client.id for client in Client.objects.filter(status=CLIENT_STATUS_ACTIVE)
+                             if not run_client_streaming_pipeline(client)]    # a failing client doesn't stop the others
+        logger.info("Streaming calendar pipeline is complete, failed clients: {}".format(failed_client_ids))
+        return
 
-def run():
     extract_run()
     transform_calendar_run()
     transform_event_run()
+    transform_busy_block_run()
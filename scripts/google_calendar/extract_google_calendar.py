@@ -5,25 +5,29 @@ import traceback
 import daiquiri
 from oauth2client.client import HttpAccessTokenRefreshError
 
+from apps.google_calendar.works import enqueue_pending_history_syncs
 from apps.visualizer.models import Client, CLIENT_STATUS_ACTIVE
+from core.sync_engine.google_calendar_free_busy import CalendarFreeBusySyncer
 from core.sync_engine.google_calendar_syncer import SyncEnvironment
 
 daiquiri.setup(level=logging.INFO)
 logger = daiquiri.getLogger()
 
 
-def run():
-    logger.info("Script: Extract Google Calendar Script Runs")
-
-    clients = Client.objects.filter(status=CLIENT_STATUS_ACTIVE)
-
-    logger.info("Number of clients to keep in sync: {}".format(len(clients)))
-
+def extract_client(client: Client, on_events_saved=None):
+    """
+    :param on_events_saved: called with the primary keys of the changed events of each saved page
+    :return: True if the client's calendars are sync'ed without an exception
+    """
     try:
-        for client in clients:
-            logger.info(" -> Sync for client id: {} email domain: {}".format(client.id, client.email_domain))
-            sync_environment = SyncEnvironment(app_client=client)
-            sync_environment.sync()
+        logger.info(" -> Sync for client id: {} email domain: {}".format(client.id, client.email_domain))
+        sync_environment = SyncEnvironment(app_client=client, on_events_saved=on_events_saved)
+        sync_environment.sync()
+        enqueue_pending_history_syncs(client)       # older events of the calendars with a sync horizon
+
+        if CalendarFreeBusySyncer.is_enabled(client):
+            CalendarFreeBusySyncer(app_client=client).sync()
+        return True
     except HttpAccessTokenRefreshError as exc:
         logger.info("Log This: Refresh Token is Failed Exception Details: {}".format(exc))
     except Exception as exc:
@@ -31,3 +35,16 @@ def run():
         logger.info("-"*60)
         traceback.print_exc(file=sys.stdout)
         logger.info("-"*60)
+
+    return False
+
+
+def run():
+    logger.info("Script: Extract Google Calendar Script Runs")
+
+    clients = Client.objects.filter(status=CLIENT_STATUS_ACTIVE)
+
+    logger.info("Number of clients to keep in sync: {}".format(len(clients)))
+
+    for client in clients:
+        extract_client(client)      # a failing client doesn't stop the others
@@ -0,0 +1,32 @@
+import logging
+import sys
+import traceback
+
+import daiquiri
+
+from apps.visualizer.models import Client, CLIENT_STATUS_ACTIVE
+from core.sync_engine.google_calendar_channels import CalendarChannelManager
+from ears.env_variables import GOOGLE_CALENDAR_NOTIFICATION_URL
+
+daiquiri.setup(level=logging.INFO)
+logger = daiquiri.getLogger()
+
+
+def run():
+    logger.info("Script: Renew Google Calendar Push Notification Channels Script Runs")
+
+    if not GOOGLE_CALENDAR_NOTIFICATION_URL:
+        logger.warning("GOOGLE_CALENDAR_NOTIFICATION_URL is not set, no channels to renew")
+        return
+
+    clients = Client.objects.filter(status=CLIENT_STATUS_ACTIVE)
+
+    for client in clients:
+        try:
+            logger.info(" -> Channels for client id: {} email domain: {}".format(client.id, client.email_domain))
+            CalendarChannelManager(app_client=client, address=GOOGLE_CALENDAR_NOTIFICATION_URL).renew_channels()
+        except Exception as exc:
+            logger.info("Log This: Unexpected Exception. Exception Details: {}".format(exc))
+            logger.info("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            logger.info("-"*60)
@@ -1,8 +1,13 @@
 import sys
 import traceback
 
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
 from apps.attent_calendar.models import AttentCalendar
 from apps.google_calendar.models import GoogleCalendar
+from apps.visualizer.models import Client
 
 import daiquiri
 import logging
@@ -11,41 +16,95 @@ daiquiri.setup(level=logging.INFO)
 logger = daiquiri.getLogger()
 
 
-def run():
-    logger.info("Script: Transform Google Calendar Script Runs")
+SYNCED_FIELDS = ('google_calendar_id', 'client_id', 'timezone')
+
+
+def get_calendar_diff(google_calendars, attent_calendars):
+    """
+    Diffs the Google Calendars kept in sync against the Attent Calendars, keyed by email address
+    :return: (rows to insert, {attent calendar id: changed fields}, attent calendar ids to delete)
+    """
+    expected_rows = {}
+    for calendar_id, email_address, client_id, calendar_timezone in google_calendars \
+            .filter(is_kept_in_sync=True) \
+            .values_list('id', 'email_address', 'sync_user__client_id', 'timezone'):
+        if client_id is None:
+            logger.info("Attent Calendar is Skipped, Sync User has no Client: {}".format(email_address))
+            continue
+
+        expected_rows[email_address] = {
+            'google_calendar_id': calendar_id,
+            'client_id': client_id,
+            'timezone': calendar_timezone,
+        }
+
+    rows_to_update = {}
+    ids_to_delete = []
+    existing_emails = set()
+
+    for row in attent_calendars.values('id', 'email_address', *SYNCED_FIELDS).order_by('id'):
+        expected_row = expected_rows.get(row['email_address'])
+
+        if expected_row is None or row['email_address'] in existing_emails:     # not kept in sync or duplicate
+            ids_to_delete.append(row['id'])
+            continue
+
+        existing_emails.add(row['email_address'])
+        changed_fields = {field: value for field, value in expected_row.items() if row[field] != value}
+        if changed_fields:
+            rows_to_update[row['id']] = changed_fields
+
+    rows_to_insert = [dict(email_address=email_address, **row) for email_address, row in expected_rows.items()
+                      if email_address not in existing_emails]
 
+    return rows_to_insert, rows_to_update, ids_to_delete
+
+
+def transform_calendars(app_client: Client=None):
+    """
+    Reconciles Attent Calendars with the Google Calendars kept in sync. Only the rows that differ are written.
+    :param app_client: transform only the calendars of the client if given, otherwise all calendars
+    :return: True if the calendars are transformed without an exception
+    """
     try:
-        # Google Calendars set to be kept in sync get created or updated as Attent Calendar
-        calendars_to_update_or_create = GoogleCalendar.objects.filter(is_kept_in_sync=True)
-
-        for calendar in calendars_to_update_or_create:
-            _, is_created = AttentCalendar.objects.update_or_create(
-                email_address=calendar.email_address,
-                defaults={
-                    'google_calendar': calendar,
-                    'client': calendar.sync_user.client,
-                    'timezone': calendar.timezone,
-                }
+        google_calendars = GoogleCalendar.objects.all()
+        attent_calendars = AttentCalendar.objects.all()
+
+        if app_client is not None:
+            google_calendars = google_calendars.filter(sync_user__client=app_client)
+            # a calendar moving between clients is matched by its email address
+            attent_calendars = attent_calendars.filter(
+                Q(client=app_client) | Q(email_address__in=google_calendars.values('email_address'))
             )
-            msg = "Attent Calendar is Created: {}" if is_created else "Attent Calendar is Updated: {}"
-            logger.info(msg.format(calendar.email_address))
 
-        # Calendars with `is_kept_in_sync` == FALSE get deleted
-        calendars_to_delete_due_to_sync_state = AttentCalendar.objects.filter(google_calendar__is_kept_in_sync=False)
+        rows_to_insert, rows_to_update, ids_to_delete = get_calendar_diff(google_calendars, attent_calendars)
+
+        with transaction.atomic():
+            AttentCalendar.objects.bulk_create([AttentCalendar(**row) for row in rows_to_insert])
+
+            now = timezone.now()
+            for attent_calendar_id, changed_fields in rows_to_update.items():
+                AttentCalendar.objects.filter(id=attent_calendar_id).update(db_updated_at=now, **changed_fields)
+
+            AttentCalendar.objects.filter(id__in=ids_to_delete).delete()
 
-        for attent_calendar in calendars_to_delete_due_to_sync_state:
-            logger.info("Attent Calendar Gets Deleted: {}".format(attent_calendar.email_address))
-            attent_calendar.delete()
+        for row in rows_to_insert:
+            logger.info("Attent Calendar is Created: {}".format(row['email_address']))
 
-        # Calendars that doesn't exists in GoogleCalendar get deleted
-        calendars_to_delete_due_to_non_existence = AttentCalendar.objects.filter(google_calendar__isnull=True)
+        if rows_to_update or ids_to_delete:
+            logger.info("Attent Calendars Updated: {}, Deleted: {}".format(len(rows_to_update), len(ids_to_delete)))
 
-        for attent_calendar in calendars_to_delete_due_to_non_existence:
-            logger.info("Attent Calendar Gets Deleted: {}".format(attent_calendar.email_address))
-            attent_calendar.delete()
+        return True
 
     except Exception as exc:
         logger.error("Log This: Unexpected Exception Exception Details: {}".format(exc))
         logger.error("-"*60)
         traceback.print_exc(file=sys.stdout)
         logger.error("-"*60)
+
+    return False
+
+
+def run():
+    logger.info("Script: Transform Google Calendar Script Runs")
+    transform_calendars()
@@ -0,0 +1,103 @@
+import sys
+import traceback
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.attent_calendar.attendee_cache import internal_attendee_cache
+from apps.attent_calendar.models import AttentCalendarEvent, AttentCalendarEventHasInternalAttendee
+from apps.google_calendar.models import GoogleCalendarBusyBlock
+from apps.visualizer.models import Client
+
+import daiquiri
+import logging
+
+daiquiri.setup(level=logging.INFO)
+logger = daiquiri.getLogger()
+
+
+def transform_busy_block_to_attent_event(busy_block: GoogleCalendarBusyBlock):
+    """
+    A busy block is a meeting of unknown type attended by the owner of the calendar
+    """
+    logger.info("Transform busy block id: {}".format(busy_block.id))
+    calendar = busy_block.calendar
+
+    defaults = {
+        'client': calendar.sync_user.client,
+        'start': busy_block.start,
+        'end': busy_block.end,
+        'creator_email_address': '',
+        'organizer_email_address': '',
+        'event_type': AttentCalendarEvent.EVENT_TYPE_UNKNOWN,
+    }
+    event, _ = AttentCalendarEvent.objects.update_or_create(google_calendar_busy_block=busy_block, defaults=defaults)
+
+    attendee_id = internal_attendee_cache.get_ids([calendar.email_address])[calendar.email_address]
+    AttentCalendarEventHasInternalAttendee.objects.update_or_create(attent_calendar_event=event,
+                                                                    internal_attendee_id=attendee_id,
+                                                                    defaults={'response_status': 'accepted'})
+
+    busy_block.process_time = timezone.now()
+    busy_block.save(update_fields=['process_time', 'db_updated_at'])
+
+
+def remove_busy_blocks_covered_by_events(app_client: Client=None):
+    """
+    A busy block overlapping an event of a synced calendar that the owner of the block attends is
+    most likely the same meeting; its Attent event is removed, so the owner's time isn't counted twice
+    """
+    block_events = AttentCalendarEvent.objects.filter(google_calendar_busy_block__isnull=False)
+
+    if app_client is not None:
+        block_events = block_events.filter(client=app_client)
+
+    covering_events = AttentCalendarEvent.objects.filter(
+        google_calendar_event__isnull=False,
+        start__lt=OuterRef('end'),
+        end__gt=OuterRef('start'),
+        internal_attendees__email_address=OuterRef('google_calendar_busy_block__calendar__email_address'),
+    )
+
+    covered_event_ids = list(block_events
+                             .annotate(is_covered=Exists(covering_events))
+                             .filter(is_covered=True)
+                             .values_list('id', flat=True))
+
+    if len(covered_event_ids) > 0:
+        logger.info("{} busy blocks are covered by synced events".format(len(covered_event_ids)))
+        AttentCalendarEvent.objects.filter(id__in=covered_event_ids).delete()
+
+
+def transform_busy_blocks(app_client: Client=None):
+    """
+    :param app_client: transform only the busy blocks of the client if given, otherwise all busy blocks
+    :return: True if the busy blocks are transformed without an exception
+    """
+    try:
+        busy_blocks = GoogleCalendarBusyBlock.objects.select_related('calendar__sync_user__client')
+
+        if app_client is not None:
+            busy_blocks = busy_blocks.filter(calendar__sync_user__client=app_client)
+
+        # blocks are never updated, a changed block is stored as a new one
+        for busy_block in busy_blocks.filter(process_time__isnull=True):
+            transform_busy_block_to_attent_event(busy_block)
+
+        # the synced event may be transformed before or after the block
+        remove_busy_blocks_covered_by_events(app_client)
+
+        return True
+
+    except Exception as exc:
+        logger.error("Log This: Unexpected Exception Exception Details: {}".format(exc))
+        logger.error("-"*60)
+        traceback.print_exc(file=sys.stdout)
+        logger.error("-"*60)
+
+    return False
+
+
+def run():
+    logger.info("Script: Transform Google Calendar Busy Block Script Runs")
+    transform_busy_blocks()
@@ -1,14 +1,20 @@
 import sys
 import traceback
+from contextlib import contextmanager, ExitStack
 
-from django.db.models import F
+import django_rq
+from django.db import transaction
 from django.utils import dateparse
 from django.utils import timezone
+from psqlextra.query import ConflictAction
 
-from apps.attent_calendar.models import AttentCalendarEvent, InternalAttendee, ExternalAttendee, \
-    AttentCalendarEventHasInternalAttendee, AttentCalendarEventHasExternalAttendee
-from apps.google_calendar.models import GoogleCalendarEvent
-from core.email_domains import is_email_address_personal
+from apps.attent_calendar.attendee_cache import internal_attendee_cache, external_attendee_cache
+from apps.attent_calendar.models import AttentCalendarEvent, AttentCalendarEventHasInternalAttendee, \
+    AttentCalendarEventHasExternalAttendee
+from apps.google_calendar.models import GoogleCalendarEvent, GoogleCalendarEventChange
+from apps.visualizer.models import Client
+from core.advisory_lock import advisory_lock, LOCK_NAMESPACE_EVENT_TRANSFORM
+from core.email_domains import EMAIL_CLASS_INTERNAL, EMAIL_CLASS_BUSINESS
 
 import daiquiri
 import logging
@@ -17,10 +23,18 @@ daiquiri.setup(level=logging.INFO)
 logger = daiquiri.getLogger()
 
 
-def transform_event_to_attent_event(gc_event: GoogleCalendarEvent):
-    logger.info("Transform event id: {}".format(gc_event.id))
-    client = gc_event.client
+TRANSFORM_BATCH_SIZE = 500
+TRANSFORM_QUEUE_NAME = 'default'
+TRANSFORM_JOB_TIMEOUT = 60 * 60     # seconds
+
+SETTING_BUCKET_COUNT = 'calendar_transform_bucket_count'    # large clients are transformed in parallel buckets
+MAX_BUCKET_COUNT = 64
+
 
+def get_attent_event_fields(gc_event: GoogleCalendarEvent, email_classes):
+    """
+    :param email_classes: dict of attendee email address -> email class, see `Client.classify_email_addresses`
+    """
     start_dict = gc_event.start
     end_dict = gc_event.end
     is_full_day_event = 'date' in start_dict
@@ -30,77 +44,295 @@ def transform_event_to_attent_event(gc_event: GoogleCalendarEvent):
     end = dateparse.parse_datetime("{}T00:00+00".format(end_dict['date'])) if is_full_day_event \
         else dateparse.parse_datetime(end_dict['dateTime'])
 
-    defaults = {
-        'google_calendar_event': gc_event,
-        'client': client,
+    # set event type
+    attendee_classes = [email_classes[att.get('email')] for att in gc_event.attendees]
+    external_atts = [email_class for email_class in attendee_classes if email_class != EMAIL_CLASS_INTERNAL]
+    business_email_atts = [email_class for email_class in external_atts if email_class == EMAIL_CLASS_BUSINESS]
+
+    if len(external_atts) == 0:
+        event_type = 'Internal'
+    elif len(business_email_atts) > 0:
+        event_type = 'External'
+    else:
+        event_type = 'Other'
+
+    return {
+        'google_calendar_event_id': gc_event.id,
+        'event_id': gc_event.event_id,
+        'client_id': gc_event.client_id,
         'summary': gc_event.summary,
         'description': gc_event.description,
         'creator_email_address': gc_event.creator.get('email', ''),
         'organizer_email_address': gc_event.organizer.get('email', ''),
         'start': start,
         'end': end,
-        'is_full_day': is_full_day_event
+        'is_full_day': is_full_day_event,
+        'event_type': event_type,
     }
-    event, _ = AttentCalendarEvent.objects.update_or_create(event_id=gc_event.event_id, defaults=defaults)
-
-    # process attendees
-    for gc_attendee in gc_event.attendees:
-        attendee_e_address = gc_attendee.get('email')
-        response_status = gc_attendee.get('responseStatus')
-        if client.is_email_address_in_domain(attendee_e_address):
-            attendee, _ = InternalAttendee.objects.get_or_create(email_address=attendee_e_address)
-
-            AttentCalendarEventHasInternalAttendee.objects.update_or_create(attent_calendar_event=event,
-                                                                            internal_attendee=attendee,
-                                                                            defaults={
-                                                                                'response_status': response_status
-                                                                            })
-
-        else:
-            attendee, _ = ExternalAttendee.objects.get_or_create(email_address=attendee_e_address)
-            AttentCalendarEventHasExternalAttendee.objects.update_or_create(attent_calendar_event=event,
-                                                                            external_attendee=attendee,
-                                                                            defaults={
-                                                                                'response_status': response_status
-                                                                            })
 
-    # set event type
-    external_atts = [att for att in gc_event.attendees if not client.is_email_address_in_domain(att.get('email'))]
-    business_email_atts = [att for att in external_atts if not is_email_address_personal(att.get('email'))]
 
-    if len(external_atts) == 0:
-        event.event_type = 'Internal'
-    elif len(business_email_atts) > 0:
-        event.event_type = 'External'
+def save_attendee_links(link_model, attendee_field, event_ids, link_rows):
+    """
+    Upserts the links of the events' current attendees and deletes the links of the removed attendees
+    :param link_rows: dict of (attent event id, attendee id) -> response status
+    """
+    stale_link_ids = [link_id for link_id, event_id, attendee_id in link_model.objects
+                      .filter(attent_calendar_event_id__in=event_ids)
+                      .values_list('id', 'attent_calendar_event_id', '{}_id'.format(attendee_field))
+                      if (event_id, attendee_id) not in link_rows]
+
+    if len(stale_link_ids) > 0:
+        link_model.objects.filter(id__in=stale_link_ids).delete()
+
+    if len(link_rows) == 0:
+        return
+
+    link_model.objects\
+        .on_conflict(['attent_calendar_event', attendee_field], ConflictAction.UPDATE)\
+        .bulk_insert([{
+            'attent_calendar_event_id': event_id,
+            '{}_id'.format(attendee_field): attendee_id,
+            'response_status': response_status,
+        } for (event_id, attendee_id), response_status in link_rows.items()])
+
+
+def transform_events_in_batch(gc_events, change_ids=()):
+    """
+    Transforms the events with a few statements per batch: the attendees of all the events are resolved
+    together, the events and the attendee links are upserted, and the events are stamped with one update
+    :param change_ids: outbox entries consumed together with the transform of the batch
+    """
+    if len(gc_events) == 0:
+        GoogleCalendarEventChange.objects.filter(id__in=change_ids).delete()
+        return
+
+    logger.info("Transform {} events, first id: {}".format(len(gc_events), gc_events[0].id))
+
+    event_rows = []
+    internal_addresses, external_addresses = set(), set()
+
+    for gc_event in gc_events:
+        gc_event.read_through_series()
+
+        # attendees are classified once per event, the event type and the attendee links use the same result
+        email_classes = gc_event.client.classify_email_addresses(att.get('email') for att in gc_event.attendees)
+        event_rows.append(get_attent_event_fields(gc_event, email_classes))
+
+        for gc_attendee in gc_event.attendees:
+            attendee_e_address = gc_attendee.get('email')
+            if not attendee_e_address:
+                continue
+
+            if email_classes[attendee_e_address] == EMAIL_CLASS_INTERNAL:
+                internal_addresses.add(attendee_e_address)
+            else:
+                external_addresses.add(attendee_e_address)
+
+    internal_attendee_ids = internal_attendee_cache.get_ids(internal_addresses)
+    external_attendee_ids = external_attendee_cache.get_ids(external_addresses)
+
+    with transaction.atomic():
+        # a meeting shared by several synced calendars is a single (canonical) Google Calendar event
+        AttentCalendarEvent.objects\
+            .on_conflict(['google_calendar_event'], ConflictAction.UPDATE)\
+            .bulk_insert(event_rows)
+
+        event_ids = dict(AttentCalendarEvent.objects
+                         .filter(google_calendar_event_id__in=[gc_event.id for gc_event in gc_events])
+                         .values_list('google_calendar_event_id', 'id'))
+
+        internal_links, external_links = {}, {}
+        for gc_event in gc_events:
+            event_id = event_ids[gc_event.id]
+
+            for gc_attendee in gc_event.attendees:
+                attendee_e_address = gc_attendee.get('email')
+                response_status = gc_attendee.get('responseStatus') or ''
+
+                if attendee_e_address in internal_attendee_ids:
+                    internal_links[(event_id, internal_attendee_ids[attendee_e_address])] = response_status
+                elif attendee_e_address in external_attendee_ids:
+                    external_links[(event_id, external_attendee_ids[attendee_e_address])] = response_status
+
+        save_attendee_links(AttentCalendarEventHasInternalAttendee, 'internal_attendee',
+                            event_ids.values(), internal_links)
+        save_attendee_links(AttentCalendarEventHasExternalAttendee, 'external_attendee',
+                            event_ids.values(), external_links)
+
+        # inherited fields are not written back
+        GoogleCalendarEvent.objects.filter(id__in=[gc_event.id for gc_event in gc_events])\
+            .update(process_time=timezone.now())
+
+        GoogleCalendarEventChange.objects.filter(id__in=change_ids).delete()
+
+
+def transform_event_to_attent_event(gc_event: GoogleCalendarEvent):
+    transform_events_in_batch([gc_event])
+
+
+def get_partition_lock_key(client_id, bucket):
+    return (client_id or 0) * MAX_BUCKET_COUNT + bucket
+
+
+@contextmanager
+def client_partitions_lock(client_id):
+    """
+    Holds all the partitions of the client, e.g. while its saved events are streamed to the transform
+    :return: context manager giving whether all the partitions are acquired
+    """
+    with ExitStack() as stack:
+        is_acquired = all(stack.enter_context(advisory_lock(LOCK_NAMESPACE_EVENT_TRANSFORM,
+                                                            get_partition_lock_key(client_id, bucket)))
+                          for bucket in range(get_bucket_count(client_id)))
+        yield is_acquired
+
+
+def transform_saved_events(event_pks):
+    """
+    Transforms the events handed over by the extract right after they are saved (streaming pipeline,
+    push notification jobs), their outbox entries are consumed. The caller holds the partitions of the events'
+    client.
+    """
+    # the changes are read before the events, so the events loaded are at least as new as the changes consumed
+    change_ids = list(GoogleCalendarEventChange.objects
+                      .filter(google_calendar_event_id__in=event_pks)
+                      .values_list('id', flat=True))
+    if len(change_ids) == 0:
+        return      # already transformed
+
+    gc_events = list(GoogleCalendarEvent.objects
+                     .select_related('client', 'recurring_series')
+                     .filter(id__in=event_pks)
+                     .order_by('id'))
+
+    transform_events_in_batch(gc_events, change_ids=change_ids)
+
+
+def transform_events_partition(client_id, bucket=0, bucket_count=1, batch_size=TRANSFORM_BATCH_SIZE):
+    """
+    Consumes the `GoogleCalendarEventChange` outbox of a partition in id order, so the cost is proportional
+    to the number of changes instead of the size of the event table. Run by the RQ worker in parallel mode.
+
+    A partition is the events of a client, or a bucket (event id modulo `bucket_count`) of them for large clients.
+    An event always falls into the same partition, and a partition is transformed by one worker at a time
+    (Postgres advisory lock), so no event is transformed by two workers at once.
+    :return: False if the partition is being transformed by another worker
+    """
+    with advisory_lock(LOCK_NAMESPACE_EVENT_TRANSFORM, get_partition_lock_key(client_id, bucket)) as is_acquired:
+        if not is_acquired:
+            logger.info("Event transform of client {} bucket {} is running elsewhere".format(client_id, bucket))
+            return False
+
+        changes = GoogleCalendarEventChange.objects.filter(client_id=client_id)
+
+        if bucket_count > 1:
+            changes = changes.extra(where=['google_calendar_event_id %% %s = %s'], params=[bucket_count, bucket])
+
+        last_change_id = 0
+        while True:
+            change_batch = list(changes.filter(id__gt=last_change_id).order_by('id')
+                                .values_list('id', 'google_calendar_event_id')[:batch_size])
+            if len(change_batch) == 0:
+                break
+
+            # an event changed several times is transformed once; a deleted event is skipped
+            gc_events = list(GoogleCalendarEvent.objects
+                             .select_related('client', 'recurring_series')
+                             .filter(id__in={gc_event_id for _, gc_event_id in change_batch})
+                             .order_by('id'))
+
+            transform_events_in_batch(gc_events, change_ids=[change_id for change_id, _ in change_batch])
+            last_change_id = change_batch[-1][0]
+
+    return True
+
+
+def get_bucket_count(client_id):
+    if client_id is None:
+        return 1
+
+    bucket_count = int(Client.objects.get(id=client_id).get_setting(SETTING_BUCKET_COUNT, 1))
+    return max(1, min(bucket_count, MAX_BUCKET_COUNT))
+
+
+def get_partitions(app_client: Client=None):
+    """
+    :return: list of (client id, bucket, bucket count) having changes to transform
+    """
+    if app_client is not None:
+        client_ids = [app_client.id]
     else:
-        event.event_type = 'Other'
+        client_ids = GoogleCalendarEventChange.objects.order_by().values_list('client_id', flat=True).distinct()
 
-    event.save()
+    partitions = []
+    for client_id in client_ids:
+        bucket_count = get_bucket_count(client_id)
+        partitions.extend((client_id, bucket, bucket_count) for bucket in range(bucket_count))
 
-    gc_event.process_time = timezone.now()
-    gc_event.save()
+    return partitions
 
 
-def run():
-    logger.info("Script: Transform Google Calendar Event Script Runs")
+def warm_up_attendee_caches(client_id):
+    internal_attendee_cache.warm_up(client_id)
+    external_attendee_cache.warm_up(client_id)
 
+
+def transform_events(app_client: Client=None, batch_size=TRANSFORM_BATCH_SIZE, warm_up_cache=False):
+    """
+    :param app_client: transform only the events of the client if given, otherwise all events
+    :param warm_up_cache: load the attendees of each client before transforming its events,
+                          worth it for long runs only
+    :return: True if the events are transformed without an exception, partitions being transformed
+             by another worker are left to it
+    """
     try:
-        gc_events_not_processed = GoogleCalendarEvent.objects.filter(process_time__isnull=True)
+        warmed_up_client_ids = set()
 
-        for gc_event in gc_events_not_processed:
-            # update or create an entry in AttentCalendarEvent.
-            # Possibility: google_calendar_event is repopulated
-            transform_event_to_attent_event(gc_event)
+        for client_id, bucket, bucket_count in get_partitions(app_client):
+            if warm_up_cache and client_id is not None and client_id not in warmed_up_client_ids:
+                warm_up_attendee_caches(client_id)
+                warmed_up_client_ids.add(client_id)
 
-        gc_events_updated = GoogleCalendarEvent.objects.filter(process_time__isnull=False, process_time__lt=F('updated'))
+            transform_events_partition(client_id, bucket, bucket_count, batch_size)
 
-        for gc_event in gc_events_updated:
-            # update or create an entry in AttentCalendarEvent.
-            # Creation should not be needed, just in case.
-            transform_event_to_attent_event(gc_event)
+        return True
 
     except Exception as exc:
         logger.error("Log This: Unexpected Exception Exception Details: {}".format(exc))
         logger.error("-"*60)
         traceback.print_exc(file=sys.stdout)
         logger.error("-"*60)
+
+    return False
+
+
+def fan_out_event_transform():
+    """
+    Parallel mode: one RQ job per partition, a partition waiting in the queue is not enqueued again
+    """
+    queue = django_rq.get_queue(TRANSFORM_QUEUE_NAME)
+
+    for client_id, bucket, bucket_count in get_partitions():
+        job_id = 'google-calendar-event-transform-{}-{}-of-{}'.format(client_id, bucket, bucket_count)
+
+        job = queue.fetch_job(job_id)
+        if job is not None and job.get_status() == 'queued':
+            continue
+
+        queue.enqueue_call(func=transform_events_partition,
+                           args=(client_id, bucket, bucket_count),
+                           timeout=TRANSFORM_JOB_TIMEOUT,
+                           job_id=job_id)
+
+
+def run(*args):
+    """
+    `--script-args=parallel` spreads the partitions over the RQ workers
+    """
+    logger.info("Script: Transform Google Calendar Event Script Runs")
+
+    if 'parallel' in args:
+        fan_out_event_transform()
+        return
+
+    transform_events(warm_up_cache=True)
@@ -1,7 +1,11 @@
 #!/usr/bin/env bash
+set -e
 
 echo "Collecting Static Files..."
 python manage.py collectstatic --noinput
 
 echo "Running Migration..."
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+
+echo "Creating Upcoming API Log Partitions..."
+python manage.py partition_api_logs
@@ -0,0 +1,16 @@
+import logging
+
+import daiquiri
+from django.core.management import call_command
+
+daiquiri.setup(level=logging.INFO)
+logger = daiquiri.getLogger()
+
+
+def run():
+    """
+    `./manage.py runscript partition_api_logs`, scheduled daily (Heroku Scheduler), so the upcoming
+    partitions of the API log tables exist and retention is applied even when there is no release
+    """
+    logger.info("Script: Partition API Logs Script Runs")
+    call_command('partition_api_logs')